@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+配置缓存
+配置文件只在变化（mtime、大小或inode改变）时重新解析，解析结果冻结为只读快照，
+定时任务线程和Web请求线程共享同一个快照，互不干扰
+"""
+
+import os
+import threading
+from types import MappingProxyType
+
+
+def freeze_config(config):
+    """把配置字典冻结为只读快照，列表转为元组"""
+    return MappingProxyType({key: tuple(value) if isinstance(value, list) else value
+                             for key, value in config.items()})
+
+
+class ConfigStore:
+    """按需重新加载的配置快照（线程安全）
+
+    loader()负责解析配置文件并返回配置字典；文件未变化时直接返回缓存的快照，不加锁也不重新解析。
+    """
+
+    def __init__(self, path, loader):
+        self.path = path
+        self.loader = loader
+        self._lock = threading.Lock()
+        self._state = (None, None)  # (文件签名, 快照)，整体替换以便无锁读取
+
+    def _signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def get(self):
+        """返回当前配置快照，配置文件变化后首次调用时重新加载"""
+        signature = self._signature()
+        cached_signature, snapshot = self._state
+        if snapshot is not None and signature == cached_signature:
+            return snapshot
+
+        with self._lock:
+            cached_signature, snapshot = self._state
+            if snapshot is None or signature != cached_signature:
+                snapshot = freeze_config(self.loader())
+                # 首次启动时loader会写出配置文件，以写出后的签名为准，避免随后重复解析
+                self._state = (self._signature() if signature is None else signature, snapshot)
+            return snapshot
+
+    def invalidate(self):
+        """丢弃缓存，下次get()时重新加载"""
+        with self._lock:
+            self._state = (None, None)
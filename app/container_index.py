@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+容器索引与目标容器选择
+目标容器除了写容器名，还可以按标签或名称正则选择；匹配在本地的容器索引上进行，
+索引由一次列表请求建立，之后由Docker事件增量维护，不需要每次运行逐个查询容器
+"""
+
+import re
+import threading
+
+# 会改变容器索引的事件：启动时加入，停止/删除时移除，重命名时更新名称
+INDEX_ACTIONS = ('start', 'die', 'destroy', 'rename')
+
+
+class ContainerSelector:
+    """目标容器选择器
+
+    name           精确的容器名（与以往一致，不需要查询索引）
+    label:key=val  带有标签key且值为val的容器；label:key 只要求带有该标签
+    re:pattern     名称完整匹配正则表达式的容器
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.name = self.label = self.value = self.pattern = None
+        if text.startswith('label:'):
+            key, sep, value = text[len('label:'):].partition('=')
+            if not key:
+                raise ValueError(f"无效的标签选择器: {text}")
+            self.label, self.value = key, value if sep else None
+        elif text.startswith('re:'):
+            try:
+                self.pattern = re.compile(text[len('re:'):])
+            except re.error as e:
+                raise ValueError(f"无效的正则表达式 {text}: {e}")
+        else:
+            self.name = text
+
+    @property
+    def is_name(self):
+        return self.name is not None
+
+    def matches(self, name, labels):
+        if self.name is not None:
+            return name == self.name
+        if self.pattern is not None:
+            return self.pattern.fullmatch(name) is not None
+        if self.label not in labels:
+            return False
+        return self.value is None or labels[self.label] == self.value
+
+    def __str__(self):
+        return self.text
+
+
+def event_labels(event):
+    """从容器事件中取出(容器名, 标签)；事件属性中除标签外还有镜像名、退出码等字段，需要去掉"""
+    attributes = dict(event.get('Actor', {}).get('Attributes') or {})
+    name = attributes.pop('name', None)
+    for key in ('image', 'exitCode', 'oldName', 'signal'):
+        attributes.pop(key, None)
+    return name, attributes
+
+
+def parse_selectors(targets):
+    """把目标容器配置解析为选择器列表，格式错误时抛出ValueError"""
+    return [ContainerSelector(target) for target in dict.fromkeys(targets) if target]
+
+
+class ContainerIndex:
+    """单个Docker节点上运行中容器的索引（容器名 -> 标签），线程安全
+
+    首次使用或invalidate()后通过一次列表请求重建；之后由apply_event()按容器事件增量更新。
+    事件流断开期间可能漏掉变化，此时应调用invalidate()，下次使用时重新列出。
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._lock = threading.Lock()
+        self._containers = {}
+        self._valid = False
+
+    def invalidate(self):
+        with self._lock:
+            self._valid = False
+
+    def refresh(self):
+        """重新列出运行中的容器"""
+        containers = {}
+        for item in self.client.list_containers():
+            for name in item.get('Names') or []:
+                containers[name.lstrip('/')] = dict(item.get('Labels') or {})
+        with self._lock:
+            self._containers = containers
+            self._valid = True
+        return containers
+
+    def containers(self, refresh=False):
+        """返回{容器名: 标签}的副本，索引失效或要求刷新时先重新列出"""
+        with self._lock:
+            if self._valid and not refresh:
+                return dict(self._containers)
+        return dict(self.refresh())
+
+    def apply_event(self, event):
+        """按容器事件更新索引，事件属性中包含容器名和全部标签"""
+        name, labels = event_labels(event)
+        action = event.get('Action')
+        if not name:
+            return
+        with self._lock:
+            if not self._valid:
+                return
+            if action == 'start':
+                self._containers[name] = labels
+            elif action in ('die', 'destroy'):
+                self._containers.pop(name, None)
+            elif action == 'rename':
+                old_name = event['Actor']['Attributes'].get('oldName', '').lstrip('/')
+                self._containers[name] = self._containers.pop(old_name, labels)
+
+    def select(self, selectors, refresh=False):
+        """返回匹配任一选择器的容器名（按名称排序）"""
+        return sorted(name for name, labels in self.containers(refresh).items()
+                      if any(selector.matches(name, labels) for selector in selectors))
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Docker Engine API客户端
+直接通过unix socket或TCP访问Docker守护进程，复用连接，避免每次操作都启动docker CLI进程
+"""
+
+import json
+import time
+import queue
+import socket
+import struct
+import http.client
+from urllib.parse import quote, urlencode, urlsplit
+
+DEFAULT_DOCKER_HOST = 'unix:///var/run/docker.sock'
+DEFAULT_TCP_PORT = 2375
+
+
+class DockerAPIError(Exception):
+    """Docker Engine API返回的错误"""
+
+    def __init__(self, status, message):
+        super().__init__(f"[{status}] {message}")
+        self.status = status
+        self.message = message
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """基于unix socket的HTTP连接"""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def request_operation(method, path):
+    """把请求路径归并为接口名，容器名和exec ID替换为{id}，用于按接口统计耗时"""
+    parts = path.split('?', 1)[0].strip('/').split('/')
+    for i in range(1, len(parts)):
+        if parts[i - 1] in ('containers', 'exec') and parts[i] != 'json':
+            parts[i] = '{id}'
+    return f"{method} /{'/'.join(parts)}"
+
+
+class DockerClient:
+    """精简的Docker Engine API客户端
+
+    维护一个长连接池（HTTP/1.1 keep-alive），多个线程并发调用时各自取用一个连接，
+    用完归还，不会为每次调用重新建立连接。
+    on_request(接口名, 耗时秒数, 是否出错)在每次请求结束后调用，用于统计调用耗时。
+    """
+
+    def __init__(self, base_url=DEFAULT_DOCKER_HOST, timeout=30, pool_size=8, on_request=None):
+        self.base_url = base_url
+        self.socket_path = None
+        self.host = self.port = None
+        if base_url.startswith('unix://'):
+            self.socket_path = base_url[len('unix://'):]
+        elif base_url.startswith(('tcp://', 'http://')):
+            # 未加密的TCP端口（dockerd -H tcp://0.0.0.0:2375）
+            parts = urlsplit(base_url)
+            if not parts.hostname:
+                raise ValueError(f"无效的Docker地址: {base_url}")
+            self.host, self.port = parts.hostname, parts.port or DEFAULT_TCP_PORT
+        else:
+            raise ValueError(f"不支持的Docker地址: {base_url}")
+        self.timeout = timeout
+        self.on_request = on_request
+        self._pool = queue.LifoQueue(maxsize=pool_size)
+
+    def __repr__(self):
+        return f"DockerClient({self.base_url!r})"
+
+    # ---- 连接管理 ----
+
+    def _new_connection(self, timeout):
+        if self.socket_path:
+            return UnixHTTPConnection(self.socket_path, timeout=timeout)
+        return http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+
+    def _open_socket(self, timeout):
+        """建立一个原始socket连接（用于exec等需要劫持连接的接口）"""
+        if not self.socket_path:
+            return socket.create_connection((self.host, self.port), timeout=timeout)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(self.socket_path)
+        return sock
+
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return self._new_connection(self.timeout)
+
+    def _release(self, conn):
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def _observe(self, method, path, start, failed):
+        if self.on_request:
+            self.on_request(request_operation(method, path), time.perf_counter() - start, failed)
+
+    def close(self):
+        """关闭连接池中的所有连接"""
+        while True:
+            try:
+                self._pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _request(self, method, path, params=None, body=None, headers=None, timeout=None):
+        """发送请求并读取完整响应，返回(状态码, 响应体)"""
+        if params:
+            path = f"{path}?{urlencode(params)}"
+        headers = dict(headers or {})
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode('utf-8')
+            headers.setdefault('Content-Type', 'application/json')
+
+        start = time.perf_counter()
+        conn = self._acquire()
+        while True:
+            reused = conn.sock is not None
+            conn.timeout = timeout or self.timeout
+            if reused:
+                conn.sock.settimeout(conn.timeout)
+            try:
+                try:
+                    conn.request(method, path, body=body, headers=headers)
+                    response = conn.getresponse()
+                except ConnectionError:
+                    if not reused:
+                        raise
+                    # 复用的长连接已被守护进程关闭（空闲超时或守护进程重启），还没有收到响应，换新连接重试一次
+                    conn.close()
+                    conn = self._new_connection(self.timeout)
+                    continue
+                data = response.read()
+            except Exception:
+                # 连接状态未知，丢弃后下次自动重连
+                conn.close()
+                self._release(conn)
+                self._observe(method, path, start, True)
+                raise
+            break
+        if response.will_close:
+            conn.close()
+        self._release(conn)
+        self._observe(method, path, start, response.status >= 500)
+        return response.status, data
+
+    @staticmethod
+    def _raise_for_status(status, data):
+        if status < 400:
+            return
+        try:
+            message = json.loads(data).get('message', '')
+        except (ValueError, AttributeError):
+            message = data.decode('utf-8', errors='replace')
+        raise DockerAPIError(status, message.strip())
+
+    # ---- 容器 ----
+
+    def ping(self, timeout=None):
+        """检查Docker守护进程是否可用"""
+        status, _ = self._request('GET', '/_ping', timeout=timeout)
+        return status == 200
+
+    def list_containers(self, all=False, filters=None, timeout=None):
+        """列出容器（默认只包含运行中的容器），返回/containers/json的结果列表"""
+        params = {'all': '1' if all else '0'}
+        if filters:
+            params['filters'] = json.dumps(filters)
+        status, data = self._request('GET', '/containers/json', params=params, timeout=timeout)
+        self._raise_for_status(status, data)
+        return json.loads(data)
+
+    def inspect_container(self, container, timeout=None):
+        """获取容器详情，容器不存在时返回None"""
+        status, data = self._request('GET', f"/containers/{quote(container)}/json", timeout=timeout)
+        if status == 404:
+            return None
+        self._raise_for_status(status, data)
+        return json.loads(data)
+
+    # ---- 事件 ----
+
+    def events(self, filters=None, since=None, timeout=None):
+        """订阅Docker事件流，逐个产出事件字典，连接断开时结束
+
+        事件流是长连接，因此使用独立连接而不占用连接池；timeout为None时一直等待新事件。
+        """
+        params = {}
+        if filters:
+            params['filters'] = json.dumps(filters)
+        if since is not None:
+            params['since'] = str(since)
+        conn = self._new_connection(timeout=timeout)
+        try:
+            conn.request('GET', f"/events?{urlencode(params)}" if params else '/events')
+            response = conn.getresponse()
+            if response.status >= 400:
+                self._raise_for_status(response.status, response.read())
+            while True:
+                line = response.readline()
+                if not line:
+                    return
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+        finally:
+            conn.close()
+
+    # ---- exec ----
+
+    def exec_create(self, container, cmd, attach_stdin=False, timeout=None):
+        """创建exec实例，返回exec ID"""
+        body = {
+            'Cmd': cmd,
+            'AttachStdin': attach_stdin,
+            'AttachStdout': True,
+            'AttachStderr': True,
+            'Tty': False,
+        }
+        status, data = self._request('POST', f"/containers/{quote(container)}/exec", body=body, timeout=timeout)
+        self._raise_for_status(status, data)
+        return json.loads(data)['Id']
+
+    def exec_start(self, exec_id, stdin=None, timeout=None):
+        """启动exec实例并等待其结束，返回(stdout, stderr)字节串
+
+        该接口会劫持HTTP连接作为原始数据流，因此使用独立的socket，而不占用连接池。
+        """
+        body = json.dumps({'Detach': False, 'Tty': False}).encode('utf-8')
+        request = (
+            f"POST /exec/{exec_id}/start HTTP/1.1\r\n"
+            "Host: docker\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: Upgrade\r\n"
+            "Upgrade: tcp\r\n"
+            "\r\n"
+        ).encode('ascii') + body
+
+        start = time.perf_counter()
+        failed = True
+        sock = self._open_socket(timeout or self.timeout)
+        try:
+            sock.sendall(request)
+            head, rest = self._read_response_head(sock)
+            status = int(head.split(b' ', 2)[1])
+            if status >= 400:
+                self._raise_for_status(status, rest)
+            if stdin is not None:
+                sock.sendall(stdin)
+                sock.shutdown(socket.SHUT_WR)
+            chunks = [rest]
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            failed = False
+        finally:
+            sock.close()
+            self._observe('POST', f"/exec/{exec_id}/start", start, failed)
+        return self._demux_stream(b''.join(chunks))
+
+    def exec_inspect(self, exec_id, timeout=None):
+        """获取exec实例状态（包含ExitCode）"""
+        status, data = self._request('GET', f"/exec/{exec_id}/json", timeout=timeout)
+        self._raise_for_status(status, data)
+        return json.loads(data)
+
+    def exec_run(self, container, cmd, stdin=None, timeout=None):
+        """在容器中执行命令，返回(退出码, stdout, stderr)"""
+        exec_id = self.exec_create(container, cmd, attach_stdin=stdin is not None, timeout=timeout)
+        stdout, stderr = self.exec_start(exec_id, stdin=stdin, timeout=timeout)
+        exit_code = self.exec_inspect(exec_id, timeout=timeout).get('ExitCode')
+        return exit_code, stdout, stderr
+
+    @staticmethod
+    def _read_response_head(sock):
+        """读取HTTP响应头，返回(状态行+头部, 剩余数据)"""
+        buffer = b''
+        while b'\r\n\r\n' not in buffer:
+            chunk = sock.recv(4096)
+            if not chunk:
+                raise DockerAPIError(0, "连接在响应头读取完成前被关闭")
+            buffer += chunk
+        head, _, rest = buffer.partition(b'\r\n\r\n')
+        return head, rest
+
+    @staticmethod
+    def _demux_stream(data):
+        """拆分Docker多路复用输出流（8字节帧头：流类型 + 3字节填充 + 4字节长度）"""
+        stdout, stderr = [], []
+        offset = 0
+        while offset + 8 <= len(data):
+            stream_type, length = struct.unpack('>BxxxL', data[offset:offset + 8])
+            payload = data[offset + 8:offset + 8 + length]
+            (stderr if stream_type == 2 else stdout).append(payload)
+            offset += 8 + length
+        return b''.join(stdout), b''.join(stderr)
+
+    # ---- 归档（文件读写） ----
+
+    def get_archive(self, container, path, timeout=None):
+        """以tar格式读取容器内的文件或目录"""
+        status, data = self._request('GET', f"/containers/{quote(container)}/archive",
+                                     params={'path': path}, timeout=timeout)
+        self._raise_for_status(status, data)
+        return data
+
+    def put_archive(self, container, path, data, timeout=None):
+        """将tar数据解压到容器内的目录"""
+        status, body = self._request('PUT', f"/containers/{quote(container)}/archive",
+                                     params={'path': path}, body=data,
+                                     headers={'Content-Type': 'application/x-tar'}, timeout=timeout)
+        self._raise_for_status(status, body)
+        return True
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Docker事件监听
+在后台线程中订阅Docker容器事件流并回调，
+用于容器启动（包括重启）后立即重新写入hosts，以及增量维护容器索引
+"""
+
+import time
+import threading
+
+
+class ContainerEventWatcher:
+    """在后台线程中监听容器事件
+
+    on_event(容器名, 事件)在监听线程中调用，耗时操作应交给其他线程。
+    连接断开（如Docker守护进程重启）后调用on_disconnect()，等待retry_delay秒自动重连，
+    并从最后收到的事件时间继续，期间发生的事件不会遗漏。
+    """
+
+    def __init__(self, client, on_event, logger, actions=('start',), retry_delay=5, on_disconnect=None):
+        self.client = client
+        self.on_event = on_event
+        self.on_disconnect = on_disconnect
+        self.logger = logger
+        self.actions = list(actions)
+        self.retry_delay = retry_delay
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='docker-events', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _run(self):
+        since = None
+        failing = False  # 连接失败只记录一次，恢复后再记录，避免Docker不可用时每次重试都刷日志
+        while not self._stopped.is_set():
+            connected_at = int(time.time())
+            try:
+                for event in self.client.events(filters={'type': ['container'], 'event': self.actions},
+                                                since=since):
+                    since = event.get('time', since)
+                    if failing:
+                        self.logger.info(f"已重新连接 {self.client.base_url} 的Docker事件流")
+                        failing = False
+                    name = event.get('Actor', {}).get('Attributes', {}).get('name')
+                    if name:
+                        self.on_event(name, event)
+                    if self._stopped.is_set():
+                        return
+                if not failing:
+                    self.logger.warning("Docker事件流已断开，稍后重新连接")
+            except Exception as e:
+                if not failing:
+                    self.logger.warning(f"监听Docker事件出错，稍后重试: {str(e)}")
+            failing = True
+            if self.on_disconnect:
+                self.on_disconnect()
+            # 重连后从断开前最后一个事件（或本次连接建立时）开始，补上断开期间的事件
+            since = since or connected_at
+            self._stopped.wait(self.retry_delay)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+事件总线
+进程内发布/订阅：日志、任务进度、IP变化、容器推送结果等事件发布一次（序列化一次），
+所有Web界面的SSE连接共享同一个事件缓冲区，不会因为打开的页面增多而重复读取文件
+"""
+
+import json
+import threading
+from collections import deque
+
+
+class EventBus:
+    """带序号的事件环形缓冲区（线程安全）
+
+    每个事件为(序号, 事件类型, JSON数据)；订阅者凭上次收到的序号继续读取，
+    缓冲区只保留最近max_events个事件。
+    """
+
+    def __init__(self, max_events=1000):
+        self._events = deque(maxlen=max_events)
+        self._last_id = 0
+        self._latest = {}  # 事件类型 -> 该类型最近一个事件的序号
+        self._closed = False
+        self._cond = threading.Condition()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def latest(self, event):
+        """某类事件最近一次的序号，从未发布过时返回0"""
+        return self._latest.get(event, 0)
+
+    def publish(self, event, data):
+        """发布事件，data会被序列化为JSON，返回事件序号"""
+        payload = json.dumps(data, ensure_ascii=False)
+        with self._cond:
+            self._last_id += 1
+            self._events.append((self._last_id, event, payload))
+            self._latest[event] = self._last_id
+            self._cond.notify_all()
+            return self._last_id
+
+    def close(self):
+        """停止所有订阅者（服务停止时调用）"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def _events_since(self, last_id):
+        """返回序号大于last_id且仍在缓冲区中的事件（调用方需持有锁）"""
+        if not self._events or last_id >= self._last_id:
+            return []
+        first = self._events[0][0]
+        return list(self._events)[max(0, last_id + 1 - first):]
+
+    def follow(self, last_id=None, heartbeat=15):
+        """持续产出新事件(序号, 事件类型, JSON数据)
+
+        last_id为None时只接收之后发布的事件；last_id大于当前最新序号时（来自重启前的进程）
+        视为序号已重置，从缓冲区开头重放。超过heartbeat秒没有新事件时产出None，
+        调用方可借此发送保活消息。事件总线关闭后结束。
+        """
+        with self._cond:
+            if last_id is None:
+                cursor = self._last_id
+            else:
+                cursor = 0 if last_id > self._last_id else last_id
+        while True:
+            with self._cond:
+                events = self._events_since(cursor)
+                if not events and not self._closed:
+                    self._cond.wait(heartbeat)
+                    events = self._events_since(cursor)
+                closed = self._closed
+            if closed:
+                return
+            if events:
+                cursor = events[-1][0]
+                yield from events
+            else:
+                yield None
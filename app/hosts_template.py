@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+hosts模板
+模板只在文件变化（mtime或大小改变）时重新解析，解析结果编译为片段列表，渲染时一次拼接
+
+模板语法：
+    {ip} {domain} {speed} {latency} {loss} {download} {colo}   字段，支持格式说明，如 {latency:.0f}
+    {{ 和 }}                                                  输出字面量花括号
+    {% for ip %} ... {% endfor %}                              循环区块，对每个IP各输出一次
+模板按域名逐个渲染；不含循环区块时整个模板对每个IP重复输出（兼容旧模板）。
+循环区块之外的字段取该域名的第一个（最优）IP。未知字段原样输出。
+"""
+
+import os
+import re
+import threading
+
+DEFAULT_TEMPLATE = "{ip} {domain} # 速度:{speed}ms"
+
+FIELD_PATTERN = re.compile(r'\{\{|\}\}|\{(\w+)(?::([^{}]*))?\}')
+LOOP_START = re.compile(r'^\s*\{%\s*for\s+ip\s*%\}\s*$')
+LOOP_END = re.compile(r'^\s*\{%\s*endfor\s*%\}\s*$')
+
+
+def compile_text(text):
+    """把一段模板文本编译为[(字面量, 字段名, 格式说明), ...]"""
+    parts = []
+    literal = []
+    pos = 0
+    for match in FIELD_PATTERN.finditer(text):
+        literal.append(text[pos:match.start()])
+        token = match.group(0)
+        if token in ('{{', '}}'):
+            literal.append(token[0])
+        else:
+            parts.append((''.join(literal), match.group(1), match.group(2) or '', token))
+            literal = []
+        pos = match.end()
+    literal.append(text[pos:])
+    parts.append((''.join(literal), None, '', ''))
+    return parts
+
+
+def compile_template(source):
+    """把模板源码编译为区块列表[(是否循环, 片段), ...]"""
+    source = source.strip('\n')
+    lines = source.splitlines()
+    if not any(LOOP_START.match(line) for line in lines):
+        # 旧模板：整个模板作为循环区块
+        return [(True, compile_text(source + '\n'))]
+
+    blocks = []
+    current, in_loop = [], False
+    for line in lines:
+        if LOOP_START.match(line) and not in_loop:
+            if current:
+                blocks.append((False, compile_text('\n'.join(current) + '\n')))
+            current, in_loop = [], True
+        elif LOOP_END.match(line) and in_loop:
+            if current:
+                blocks.append((True, compile_text('\n'.join(current) + '\n')))
+            current, in_loop = [], False
+        else:
+            current.append(line)
+    if current:
+        blocks.append((in_loop, compile_text('\n'.join(current) + '\n')))
+    return blocks
+
+
+def _render_parts(parts, context, out):
+    for literal, field, spec, raw in parts:
+        out.append(literal)
+        if field is None:
+            continue
+        if field not in context:
+            out.append(raw)
+            continue
+        try:
+            out.append(format(context[field], spec))
+        except (TypeError, ValueError):
+            out.append(str(context[field]))
+
+
+def record_context(record, domain):
+    """模板字段取值"""
+    return {
+        'ip': record.ip,
+        'domain': domain,
+        'speed': record.speed,
+        'latency': record.latency,
+        'loss': record.loss_rate,
+        'download': record.download_speed,
+        'colo': record.colo,
+    }
+
+
+class HostsTemplate:
+    """按需重新加载的已编译hosts模板（线程安全）"""
+
+    def __init__(self, path, default=DEFAULT_TEMPLATE):
+        self.path = path
+        self.default = default
+        self._lock = threading.Lock()
+        self._signature = None
+        self._blocks = compile_template(default)
+
+    def _current_blocks(self):
+        try:
+            stat = os.stat(self.path)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+
+        with self._lock:
+            if signature != self._signature:
+                source = ''
+                if signature is not None:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        source = f.read().strip()
+                self._blocks = compile_template(source or self.default)
+                self._signature = signature
+            return self._blocks
+
+    def render(self, ip_table):
+        """渲染 域名 -> IP列表 对照表，返回所有条目行（以换行结尾）"""
+        blocks = self._current_blocks()
+        out = []
+        for domain, records in ip_table.items():
+            if not records:
+                continue
+            head = record_context(records[0], domain)
+            for is_loop, parts in blocks:
+                if is_loop:
+                    for record in records:
+                        _render_parts(parts, record_context(record, domain), out)
+                else:
+                    _render_parts(parts, head, out)
+        return ''.join(out)
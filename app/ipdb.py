@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+IP质量数据库
+使用SQLite保存每次测速中所有IP的延迟、丢包率和下载速度，供按历史表现优选IP
+"""
+
+import time
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    source TEXT NOT NULL,
+    ip_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS measurements (
+    run_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    ip TEXT NOT NULL,
+    latency REAL,
+    loss_rate REAL,
+    download_speed REAL,
+    colo TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_measurements_ip_ts ON measurements (ip, ts);
+CREATE INDEX IF NOT EXISTS idx_measurements_ts ON measurements (ts);
+"""
+
+# 综合评分：平均延迟 + 丢包惩罚（每1%丢包折算为10ms延迟），越小越好
+SCORE_SQL = "AVG(latency) + AVG(loss_rate) * 1000"
+
+STATS_SQL = f"""
+SELECT ip,
+       COUNT(*) AS samples,
+       AVG(latency) AS avg_latency,
+       MIN(latency) AS min_latency,
+       MAX(latency) AS max_latency,
+       AVG(latency * latency) - AVG(latency) * AVG(latency) AS latency_variance,
+       AVG(loss_rate) AS avg_loss,
+       AVG(download_speed) AS avg_download,
+       MAX(ts) AS last_seen,
+       MAX(colo) AS colo,
+       {SCORE_SQL} AS score
+FROM measurements
+WHERE ts >= ?
+GROUP BY ip
+"""
+
+
+class IPQualityDB:
+    """按IP保存测速时间序列的本地数据库（线程安全）"""
+
+    def __init__(self, path, retention_days=30):
+        self.path = path
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def record_run(self, records, source='cloudflarest', ts=None):
+        """在一个事务中写入一次测速的全部结果，返回写入条数
+
+        records中的元素需具有ip、latency、loss_rate、download_speed、colo属性；
+        没有收到任何回复（received为0）的记录延迟保存为NULL，不参与延迟统计，只计入丢包率。
+        """
+        ts = ts or time.time()
+        rows = [(r.ip, None if getattr(r, 'received', None) == 0 else r.latency,
+                 r.loss_rate, r.download_speed, r.colo) for r in records]
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                cursor = conn.execute("INSERT INTO runs (ts, source, ip_count) VALUES (?, ?, ?)",
+                                      (ts, source, len(rows)))
+                run_id = cursor.lastrowid
+                conn.executemany(
+                    "INSERT INTO measurements (run_id, ts, ip, latency, loss_rate, download_speed, colo) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(run_id, ts) + row for row in rows])
+                if self.retention_days:
+                    cutoff = ts - self.retention_days * 86400
+                    conn.execute("DELETE FROM measurements WHERE ts < ?", (cutoff,))
+                    conn.execute("DELETE FROM runs WHERE ts < ?", (cutoff,))
+        return len(rows)
+
+    def _query(self, sql, params):
+        with self._lock:
+            return [dict(row) for row in self._connection().execute(sql, params).fetchall()]
+
+    def best_ips(self, since_seconds=86400, limit=10, min_samples=1, max_loss=None):
+        """最近since_seconds秒内综合评分最好的IP"""
+        sql = f"SELECT * FROM ({STATS_SQL}) WHERE samples >= ?"
+        params = [time.time() - since_seconds, min_samples]
+        if max_loss is not None:
+            sql += " AND avg_loss <= ?"
+            params.append(max_loss)
+        # 全部测量都没有回复的IP没有延迟和评分，排在最后
+        sql += " ORDER BY score IS NULL, score ASC LIMIT ?"
+        params.append(limit)
+        return self._query(sql, params)
+
+    def stable_ips(self, since_seconds=86400, limit=10, min_samples=3, max_stddev=20.0, max_loss=0.0):
+        """最近一段时间内多次出现、延迟波动小且无丢包的IP"""
+        sql = (f"SELECT * FROM ({STATS_SQL}) "
+               "WHERE samples >= ? AND latency_variance <= ? AND avg_loss <= ? "
+               "ORDER BY score ASC LIMIT ?")
+        params = [time.time() - since_seconds, min_samples, max_stddev * max_stddev, max_loss, limit]
+        return self._query(sql, params)
+
+    def ip_history(self, ip, since_seconds=86400):
+        """单个IP的测量时间序列（按时间升序）"""
+        return self._query(
+            "SELECT ts, latency, loss_rate, download_speed, colo FROM measurements "
+            "WHERE ip = ? AND ts >= ? ORDER BY ts ASC",
+            (ip, time.time() - since_seconds))
+
+    def last_run(self, source=None):
+        """最近一次测速（可按来源过滤，source可为字符串或多个来源的元组）的概要，没有记录时返回None"""
+        if source:
+            sources = (source,) if isinstance(source, str) else tuple(source)
+            placeholders = ', '.join('?' * len(sources))
+            rows = self._query(f"SELECT * FROM runs WHERE source IN ({placeholders}) ORDER BY ts DESC LIMIT 1",
+                               sources)
+        else:
+            rows = self._query("SELECT * FROM runs ORDER BY ts DESC LIMIT 1", ())
+        return rows[0] if rows else None
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+后台任务
+在独立线程中串行运行耗时操作（如测速），记录输出行，供Web界面实时跟随和查询
+"""
+
+import time
+import uuid
+import threading
+from collections import deque, OrderedDict
+
+
+class Job:
+    """一个后台任务及其输出缓冲区"""
+
+    def __init__(self, kind, name, max_lines=1000, listener=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind  # 同类任务会被合并
+        self.name = name
+        self.status = 'pending'  # pending / running / succeeded / failed
+        self.message = ''
+        self.coalesced = 0  # 被合并到本任务的重复触发次数
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lines = deque(maxlen=max_lines)
+        self._total = 0  # 累计写入的行数，作为跟随输出时的游标
+        self._cond = threading.Condition()
+        # 可选回调listener(事件类型, 任务, 输出行)，状态变化时事件类型为'job'，新输出为'progress'
+        self._listener = listener
+
+    def _notify(self, event, line=None):
+        if self._listener:
+            try:
+                self._listener(event, self, line)
+            except Exception:
+                pass
+
+    @property
+    def done(self):
+        return self.status in ('succeeded', 'failed')
+
+    @property
+    def duration(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def append(self, line):
+        """追加一行输出并唤醒所有跟随者"""
+        with self._cond:
+            self._lines.append(line)
+            self._total += 1
+            self._cond.notify_all()
+        self._notify('progress', line)
+
+    def finish(self, success, message=''):
+        with self._cond:
+            self.status = 'succeeded' if success else 'failed'
+            self.message = message
+            self.finished_at = time.time()
+            self._cond.notify_all()
+        self._notify('job')
+
+    def _lines_since(self, cursor):
+        """返回游标之后仍在缓冲区中的行和新游标（调用方需持有锁）"""
+        first = self._total - len(self._lines)
+        start = max(cursor, first)
+        return list(self._lines)[start - first:], self._total
+
+    def follow(self, cursor=0, heartbeat=15):
+        """逐行跟随任务输出，直到任务结束且输出读完
+
+        超过heartbeat秒没有新输出时产出None，调用方可借此发送保活消息。
+        """
+        while True:
+            with self._cond:
+                lines, cursor = self._lines_since(cursor)
+                if not lines and not self.done:
+                    self._cond.wait(heartbeat)
+                    lines, cursor = self._lines_since(cursor)
+                finished = self.done
+            if lines:
+                yield from lines
+            elif finished:
+                return
+            else:
+                yield None
+
+    def wait(self, timeout=None):
+        """等待任务结束，返回是否已结束"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.done, timeout)
+
+    def run(self, target, *args, **kwargs):
+        """在当前线程中运行target(job, *args, **kwargs)
+
+        target返回(是否成功, 说明信息)；抛出异常时任务标记为失败。
+        """
+        with self._cond:
+            self.status = 'running'
+            self.started_at = time.time()
+        self._notify('job')
+        try:
+            success, message = target(self, *args, **kwargs)
+        except Exception as e:
+            success, message = False, f"{self.name}出错: {str(e)}"
+        self.finish(success, message)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'name': self.name,
+            'status': self.status,
+            'success': self.status == 'succeeded',
+            'message': self.message,
+            'coalesced': self.coalesced,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'duration': round(self.duration, 3),
+        }
+
+
+class JobRunner:
+    """单飞任务执行器
+
+    所有任务在同一个工作线程中依次执行，因此不会有两个测速进程同时写入result.csv。
+    触发的任务若与正在运行或排队中的任务同类，则直接合并到该任务，返回其ID；
+    coalesce_running=False时只合并到排队中的任务（正在运行的任务已读取了旧的状态，如配置）。
+    """
+
+    def __init__(self, history_size=50, listener=None):
+        self.history_size = history_size
+        self.listener = listener  # 传给每个任务的事件回调
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._current = None
+        self._jobs = OrderedDict()  # 任务ID -> 任务，保留最近history_size个
+        self._worker = None
+
+    @property
+    def current(self):
+        return self._current
+
+    def submit(self, kind, name, target, *args, coalesce_running=True, **kwargs):
+        """提交任务，返回(任务, 是否新建)"""
+        with self._cond:
+            running = [self._current] if self._current and coalesce_running else []
+            active = running + [entry[0] for entry in self._pending]
+            for job in active:
+                if job.kind == kind:
+                    job.coalesced += 1
+                    return job, False
+
+            job = Job(kind, name, listener=self.listener)
+            self._pending.append((job, target, args, kwargs))
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history_size:
+                oldest_id = next(iter(self._jobs))
+                if not self._jobs[oldest_id].done:
+                    break
+                self._jobs.pop(oldest_id)
+
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run_forever, name='job-runner', daemon=True)
+                self._worker.start()
+            # 在锁内通知，保证pending事件先于running事件发布
+            job._notify('job')
+            self._cond.notify_all()
+            return job, True
+
+    def run(self, kind, name, target, *args, **kwargs):
+        """提交任务并等待其结束（供定时任务等同步调用方使用）"""
+        job, _ = self.submit(kind, name, target, *args, **kwargs)
+        job.wait()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        """返回最近的任务（新任务在前）"""
+        with self._cond:
+            return list(reversed(self._jobs.values()))
+
+    def _run_forever(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job, target, args, kwargs = self._pending.popleft()
+                self._current = job
+            try:
+                job.run(target, *args, **kwargs)
+            finally:
+                with self._cond:
+                    self._current = None
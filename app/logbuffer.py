@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+结构化日志
+日志记录转为字典（时间、级别、消息以及通过extra传入的事件类型、容器、耗时、IP等字段），
+以JSON行写入轮转日志文件，同时保存在内存环形缓冲区中，Web界面和接口读取日志不需要访问磁盘
+"""
+
+import json
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+
+from logtail import tail_lines
+
+# LogRecord的标准属性，其余属性都是通过extra传入的结构化字段
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+def record_fields(record):
+    """取出通过extra传入的结构化字段"""
+    return {key: value for key, value in vars(record).items()
+            if key not in _STANDARD_ATTRS and not key.startswith('_')}
+
+
+def record_to_dict(record, tz=None):
+    """把日志记录转为可JSON序列化的字典"""
+    entry = {
+        'ts': round(record.created, 3),
+        'time': datetime.fromtimestamp(record.created, tz).strftime('%Y-%m-%d %H:%M:%S'),
+        'level': record.levelname,
+        'logger': record.name,
+        'message': record.getMessage(),
+    }
+    entry.update(record_fields(record))
+    if record.exc_info:
+        entry['exc'] = logging.Formatter().formatException(record.exc_info)
+    return entry
+
+
+def entry_text(entry):
+    """日志条目的单行文本（与控制台日志格式一致）"""
+    return f"{entry['time']} - {entry['logger']} - {entry['level']} - {entry['message']}"
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON"""
+
+    def __init__(self, tz=None):
+        super().__init__()
+        self.tz = tz
+
+    def format(self, record):
+        return json.dumps(record_to_dict(record, self.tz), ensure_ascii=False, default=str)
+
+
+class LogBuffer(logging.Handler):
+    """内存中的日志环形缓冲区（线程安全）
+
+    每条日志保存为带递增序号的字典，只保留最近capacity条；listener(条目)在每条日志写入后调用，
+    用于推送给Web界面。
+    """
+
+    def __init__(self, capacity=2000, tz=None, listener=None, level=logging.NOTSET):
+        super().__init__(level)
+        self.tz = tz
+        self.listener = listener
+        self._entries = deque(maxlen=capacity)
+        self._last_id = 0
+        self._buffer_lock = threading.Lock()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def _append(self, entry):
+        with self._buffer_lock:
+            self._last_id += 1
+            entry = dict(entry, id=self._last_id, text=entry_text(entry))
+            self._entries.append(entry)
+        return entry
+
+    def emit(self, record):
+        try:
+            entry = self._append(record_to_dict(record, self.tz))
+            if self.listener:
+                self.listener(entry)
+        except Exception:
+            self.handleError(record)
+
+    def load(self, path, lines=None):
+        """启动时从JSON日志文件末尾恢复最近的日志，返回恢复的条数"""
+        try:
+            text = tail_lines(path, lines or self._entries.maxlen)
+        except OSError:
+            return 0
+        count = 0
+        for line in text.splitlines():
+            try:
+                entry = json.loads(line)
+                entry_text(entry)
+            except (ValueError, KeyError, TypeError):
+                continue
+            self._append(entry)
+            count += 1
+        return count
+
+    def query(self, since=None, limit=None, level=None, event=None, container=None):
+        """按条件读取日志，返回(条目列表, 最新序号, 是否有被挤出缓冲区的条目)
+
+        since为上次读取到的序号，只返回之后的条目；since大于最新序号时（来自重启前的进程）
+        视为序号已重置，返回整个缓冲区并标记为有缺口。level为最低级别；limit只保留最后limit条。
+        """
+        min_level = logging.getLevelName(level.upper()) if level else None
+        if not isinstance(min_level, int):
+            min_level = None
+        with self._buffer_lock:
+            entries = list(self._entries)
+            last_id = self._last_id
+        reset = since is not None and since > last_id
+        if reset:
+            since = 0
+        gap = reset or (since is not None and entries and entries[0]['id'] > since + 1)
+        entries = [entry for entry in entries
+                   if (since is None or entry['id'] > since)
+                   and (min_level is None or logging.getLevelName(entry['level']) >= min_level)
+                   and (event is None or entry.get('event') == event)
+                   and (container is None or entry.get('container') == container)]
+        if limit is not None:
+            entries = entries[-limit:] if limit > 0 else []
+        return entries, last_id, bool(gap)
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+日志读取
+从文件末尾反向按块读取最后N行，
+读取的开销只与返回的数据量有关，与日志文件大小无关
+"""
+
+import os
+
+BLOCK_SIZE = 8192
+
+
+def tail_lines(path, lines=50, block_size=BLOCK_SIZE):
+    """读取文件最后lines行"""
+    with open(path, 'rb') as f:
+        position = os.fstat(f.fileno()).st_size
+        data = b''
+        # 多读一个换行符：文件通常以换行结尾，需要lines+1个换行才能确定lines行的起点
+        while position > 0 and data.count(b'\n') <= lines:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            data = f.read(step) + data
+    text = b'\n'.join(data.split(b'\n')[-(lines + 1):]) if lines > 0 else b''
+    return text.decode('utf-8', errors='replace')
+
@@ -6,24 +6,62 @@ CloudflareIP-Hosts更新器主程序
 定时运行CloudflareSpeedTest获取最优IP，并更新容器hosts文件
 """
 
+import io
 import os
+import sys
+import re
+import csv
+import hashlib
 import json
 import time
 import logging
+import logging.handlers
+import socket
+import shutil
+import tarfile
+import tempfile
+import threading
 import subprocess
-import schedule
 import toml
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache, partial
+from itertools import islice
 from datetime import datetime, timezone, timedelta
+from docker_api import DockerClient, DockerAPIError, DEFAULT_DOCKER_HOST
+from docker_events import ContainerEventWatcher
+from container_index import ContainerIndex, INDEX_ACTIONS, event_labels, parse_selectors
+from jobs import JobRunner
+from scheduler import Scheduler, IntervalSchedule, CronSchedule
+from events import EventBus
+from logbuffer import LogBuffer, JsonFormatter
+from config_store import ConfigStore
+from metrics import Registry
+from ipdb import IPQualityDB
+from records import SpeedTestRecord
+from hosts_template import HostsTemplate
+from prober import probe_ips, probe_server_names, rank_records, run_builtin_speedtest
+
+# 以脚本方式运行时，让web模块的 `from main import ...` 引用本模块，
+# 避免再导入一份main而产生第二套任务执行器、事件总线等全局状态
+if __name__ == '__main__':
+    sys.modules.setdefault('main', sys.modules[__name__])
 
 VERSION = "1.0.6"
 
 # 设置默认时区为Asia/Shanghai (UTC+8)
 TIMEZONE = timezone(timedelta(hours=8))
 
-# 文件路径
-HOSTS_FILE = '/app/data/hosts'
+# 文件路径（DATA_DIR可改为其他目录，如在容器外运行基准测试时）
+DATA_DIR = os.environ.get('DATA_DIR', '/app/data')
+HOSTS_FILE = os.path.join(DATA_DIR, 'hosts')
 UPDATE_HISTORY_FILE = os.path.join(os.path.dirname(HOSTS_FILE), 'update_history.json')
 
+# hosts备份保留策略（本地data目录和容器内/etc均适用）：最多保留的份数，以及可选的最长保留时间
+HOSTS_BACKUP_KEEP = int(os.environ.get('HOSTS_BACKUP_KEEP', '10'))
+CONTAINER_BACKUP_KEEP = int(os.environ.get('CONTAINER_BACKUP_KEEP', '3'))
+HOSTS_BACKUP_MAX_AGE = os.environ.get('HOSTS_BACKUP_MAX_AGE', '')
+
 # 自定义日志格式化器，使用上海时区
 class TimezoneFormatter(logging.Formatter):
     def converter(self, timestamp):
@@ -37,21 +75,63 @@ class TimezoneFormatter(logging.Formatter):
         else:
             return dt.strftime('%Y-%m-%d %H:%M:%S')
 
-# 配置日志
+# 配置日志：控制台输出文本；文件为JSON行（按大小轮转，保留LOG_BACKUP_COUNT个历史文件）；
+# Web界面和接口从内存中的环形缓冲区读取最近LOG_BUFFER_SIZE条结构化日志
+LOG_FILE = os.path.join(DATA_DIR, 'updater.jsonl')
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', str(5 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', '3'))
+LOG_BUFFER_SIZE = int(os.environ.get('LOG_BUFFER_SIZE', '2000'))
 formatter = TimezoneFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 stream_handler = logging.StreamHandler()
 stream_handler.setFormatter(formatter)
-file_handler = logging.FileHandler('/app/data/updater.log')
-file_handler.setFormatter(formatter)
+file_handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES,
+                                                    backupCount=LOG_BACKUP_COUNT, encoding='utf-8')
+file_handler.setFormatter(JsonFormatter(TIMEZONE))
+
+# 事件总线：日志、任务进度、IP变化和容器推送结果统一通过它推送给Web界面
+event_bus = EventBus()
+log_buffer = LogBuffer(capacity=LOG_BUFFER_SIZE, tz=TIMEZONE,
+                       listener=lambda entry: event_bus.publish('log', entry))
+# 先恢复上次运行的最近日志，重启后页面上仍能看到
+log_buffer.load(LOG_FILE)
 
 logging.basicConfig(
     level=logging.INFO,
-    handlers=[stream_handler, file_handler]
+    handlers=[stream_handler, file_handler, log_buffer]
 )
 logger = logging.getLogger('cloudflare-hosts-updater')
 
+# 原子写入文件：先写同目录临时文件并fsync，再rename替换，读者不会看到写了一半的文件
+def atomic_write(path, content, encoding='utf-8'):
+    directory = os.path.dirname(path) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding) as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        # 沿用原文件权限，新文件默认0644（mkstemp创建的是0600）
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except OSError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    # 确保rename本身落盘
+    dir_fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
 # 配置文件路径
-CONFIG_TOML = '/app/data/config.toml'
+CONFIG_TOML = os.path.join(DATA_DIR, 'config.toml')
 ENV_FILE = './.env'
 
 # 默认配置
@@ -67,13 +147,63 @@ DEFAULT_CONFIG = {
 # 硬编码的标记，不允许用户修改
 HOSTS_MARKER = '# CloudflareIP-HostsUpdater'
 
-# 全局配置变量
-CONFIG = {}
+# 后台任务执行器：测速与hosts更新在同一工作线程中串行执行，重复触发会被合并
+def publish_job_event(event, job, line=None):
+    """把任务状态变化和输出发布到事件总线"""
+    if event == 'progress':
+        event_bus.publish('progress', {'job_id': job.id, 'line': line})
+    else:
+        event_bus.publish('job', job.to_dict())
+
+job_runner = JobRunner(listener=publish_job_event)
+
+# 运行指标，由Web服务的/metrics接口按Prometheus文本格式输出
+metrics = Registry()
+SPEEDTEST_DURATION = metrics.histogram('cfhosts_speedtest_duration_seconds', '完整测速耗时（秒）', ['engine'])
+SPEEDTESTS = metrics.counter('cfhosts_speedtests', '完整测速次数', ['engine', 'result'])
+PARSE_DURATION = metrics.histogram('cfhosts_result_parse_duration_seconds', '测速结果文件解析耗时（秒）',
+                                   buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1))
+PUSH_DURATION = metrics.histogram('cfhosts_container_push_duration_seconds', '单个容器hosts推送耗时（秒）', ['node'])
+CONTAINER_PUSHES = metrics.counter('cfhosts_container_pushes', '容器hosts推送次数', ['node', 'status'])
+DOCKER_REQUEST_DURATION = metrics.histogram('cfhosts_docker_request_duration_seconds',
+                                            'Docker Engine API调用耗时（秒）', ['node', 'operation'])
+DOCKER_REQUEST_ERRORS = metrics.counter('cfhosts_docker_request_errors', 'Docker Engine API调用出错次数',
+                                        ['node', 'operation'])
+UPDATES = metrics.counter('cfhosts_updates', 'hosts更新流程次数', ['trigger', 'result'])
+SELECTED_IP_LATENCY = metrics.gauge('cfhosts_selected_ip_latency_ms', '当前写入hosts的IP的延迟（毫秒）',
+                                    ['domain', 'ip'])
+# 最近一次hosts更新成功的时间戳，启动时取hosts文件的修改时间
+last_success_time = os.path.getmtime(HOSTS_FILE) if os.path.exists(HOSTS_FILE) else None
+LAST_SUCCESS = metrics.gauge('cfhosts_last_success_timestamp_seconds', '最近一次hosts更新成功的时间',
+                             function=lambda: last_success_time)
+SINCE_LAST_SUCCESS = metrics.gauge('cfhosts_seconds_since_last_success', '距最近一次hosts更新成功的秒数',
+                                   function=lambda: last_success_time and time.time() - last_success_time)
+
+def record_docker_request(node, operation, seconds, failed):
+    """DockerClient的请求回调：按节点和接口统计耗时"""
+    DOCKER_REQUEST_DURATION.observe(seconds, node=node, operation=operation)
+    if failed:
+        DOCKER_REQUEST_ERRORS.inc(node=node, operation=operation)
+
+def record_update(trigger, success):
+    """记录一次hosts更新流程的结果"""
+    global last_success_time
+    UPDATES.inc(trigger=trigger, result='success' if success else 'failure')
+    if success:
+        last_success_time = time.time()
+
+def record_selected_ips(ip_table):
+    """记录写入hosts的每个域名的IP及其延迟，替换上一次的记录"""
+    SELECTED_IP_LATENCY.clear()
+    for domain, ip_list in ip_table.items():
+        for record in ip_list:
+            SELECTED_IP_LATENCY.set(record.latency, domain=domain, ip=record.ip)
+
 IS_FIRST_RUN = False  # 全局变量，记录是否为首次启动
 
-# 加载配置（根据config.toml是否存在区分初次启动和非初次启动）
-def load_config():
-    global CONFIG, IS_FIRST_RUN
+# 解析配置（根据config.toml是否存在区分初次启动和非初次启动），只在配置文件变化时由config_store调用
+def _read_config():
+    global IS_FIRST_RUN
     
     # 首先判断是否为初次启动（config.toml不存在）
     is_first_run = not os.path.exists(CONFIG_TOML) or os.path.getsize(CONFIG_TOML) == 0
@@ -102,9 +232,6 @@ def load_config():
         if isinstance(config['CF_DOMAINS'], str):
             config['CF_DOMAINS'] = [d.strip() for d in config['CF_DOMAINS'].split(',') if d.strip()]
         
-        # 更新全局配置
-        CONFIG = config
-        
         # 将初始配置保存到config.toml以便下次使用
         save_initial_config(config)
         
@@ -149,12 +276,15 @@ def load_config():
         if isinstance(config['CF_DOMAINS'], str):
             config['CF_DOMAINS'] = [d.strip() for d in config['CF_DOMAINS'].split(',') if d.strip()]
         
-        # 更新全局配置
-        CONFIG = config
-    
     logger.info("配置加载完成")
     return config
 
+config_store = ConfigStore(CONFIG_TOML, _read_config)
+
+def load_config():
+    """返回当前配置的只读快照（配置文件未变化时不会重新解析）"""
+    return config_store.get()
+
 # 保存初始配置到config.toml（仅首次启动时调用）
 def save_initial_config(config):
     try:
@@ -181,9 +311,8 @@ def save_initial_config(config):
             }
         }
         
-        # 写入TOML文件
-        with open(CONFIG_TOML, 'w') as f:
-            toml.dump(toml_data, f)
+        # 原子写入TOML文件
+        atomic_write(CONFIG_TOML, toml.dumps(toml_data))
         
         logger.info(f"初始配置已保存到 {CONFIG_TOML}")
         return True
@@ -198,13 +327,13 @@ def save_config(config):
         os.makedirs(os.path.dirname(CONFIG_TOML), exist_ok=True)
         
         # 复制一份配置以避免修改原始对象
-        config_to_save = config.copy()
+        config_to_save = dict(config)
         
         # 将列表转换为逗号分隔的字符串
-        if isinstance(config_to_save['TARGET_CONTAINERS'], list):
+        if isinstance(config_to_save['TARGET_CONTAINERS'], (list, tuple)):
             config_to_save['TARGET_CONTAINERS'] = ','.join(config_to_save['TARGET_CONTAINERS'])
         
-        if isinstance(config_to_save['CF_DOMAINS'], list):
+        if isinstance(config_to_save['CF_DOMAINS'], (list, tuple)):
             config_to_save['CF_DOMAINS'] = ','.join(config_to_save['CF_DOMAINS'])
         
         # 准备TOML格式数据
@@ -219,61 +348,153 @@ def save_config(config):
             }
         }
         
-        # 写入TOML文件
-        with open(CONFIG_TOML, 'w') as f:
-            toml.dump(toml_data, f)
+        # 原子写入TOML文件
+        atomic_write(CONFIG_TOML, toml.dumps(toml_data))
         
         logger.info(f"用户配置已保存到 {CONFIG_TOML}")
         
-        # 重新加载配置以确保全局变量更新
-        load_config()
+        # 丢弃缓存的配置快照，下次读取时加载新配置
+        config_store.invalidate()
         
-        # 重置定时任务以应用新的更新间隔
-        reset_scheduler()
+        # 唤醒调度器，按新的更新间隔重新计算下一次执行时间
+        scheduler.reschedule()
         
         return True
     except Exception as e:
         logger.error(f"保存配置失败: {str(e)}")
         return False
 
-# 重置定时任务调度器
-def reset_scheduler():
-    """重置定时任务调度器以应用新的更新间隔"""
-    try:
-        # 清除所有现有任务
-        schedule.clear()
-        
-        # 解析更新间隔并设置新的定时任务
-        interval_seconds = parse_time_interval(CONFIG['UPDATE_INTERVAL'])
-        logger.info(f"重置定时任务，新间隔: {interval_seconds}秒")
-        
-        # 记录下一次定时任务的执行时间（使用上海时区）
-        next_run = time.time() + interval_seconds
-        next_run_time = datetime.fromtimestamp(next_run, TIMEZONE)
-        logger.info(f"下一次定时任务将在 {next_run_time.strftime('%Y-%m-%d %H:%M:%S')} 执行")
-        
-        # 设置新的定时任务
-        schedule.every(interval_seconds).seconds.do(update_all_hosts, is_scheduled=True)
-        
-        return True
-    except Exception as e:
-        logger.error(f"重置定时任务失败: {str(e)}")
-        return False
+# 定时更新的随机抖动上限（如 10m），避免多个实例在同一时刻测速
+UPDATE_JITTER = os.environ.get('UPDATE_JITTER', '')
 
-# 初始加载配置
-CONFIG = load_config()
+def current_schedule():
+    """根据配置的UPDATE_INTERVAL返回执行计划：5个字段时按cron表达式（UTC+8），否则为固定间隔"""
+    interval = str(load_config()['UPDATE_INTERVAL']).strip()
+    if len(interval.split()) == 5:
+        try:
+            schedule = CronSchedule(interval, TIMEZONE)
+            # 能解析但永远不会触发的表达式（如 0 0 30 2 *）在这里就回退，而不是在调度线程中出错
+            schedule.next_after(time.time())
+            return schedule
+        except ValueError as e:
+            logger.warning(f"无效的cron表达式: {str(e)}，使用默认值12小时")
+            return IntervalSchedule(12 * 3600)
+    return IntervalSchedule(parse_time_interval(interval))
 
-# 从全局配置中获取变量
-UPDATE_INTERVAL = CONFIG['UPDATE_INTERVAL']
-TARGET_CONTAINERS = CONFIG['TARGET_CONTAINERS']
-CF_DOMAINS = CONFIG['CF_DOMAINS']
-IP_COUNT = CONFIG['IP_COUNT']
-PREFERRED_IP = CONFIG['PREFERRED_IP']
-SPEED_TEST_ARGS = CONFIG['SPEED_TEST_ARGS']
+def log_next_run(next_run):
+    """记录下一次定时任务的执行时间（使用上海时区）"""
+    next_run_time = datetime.fromtimestamp(next_run, TIMEZONE)
+    logger.info(f"定时任务计划: {current_schedule()}，下一次将在 {next_run_time.strftime('%Y-%m-%d %H:%M:%S')} 执行",
+                extra={'event': 'schedule', 'next_run': round(next_run, 3)})
+
+# 初始加载配置（同时确定是否为首次启动）
+load_config()
 
 # 文件路径
-SPEEDTEST_RESULT = '/app/data/result.csv'
-HOSTS_TEMPLATE = '/app/data/template.hosts'
+SPEEDTEST_RESULT = os.path.join(DATA_DIR, 'result.csv')
+HOSTS_TEMPLATE = os.path.join(DATA_DIR, 'template.hosts')
+CLOUDFLAREST_BIN = os.environ.get('CLOUDFLAREST_BIN', '/app/CloudflareST')
+hosts_template = HostsTemplate(HOSTS_TEMPLATE)
+
+# 容器hosts并发推送参数（并发数、单个容器超时秒数）
+PUSH_WORKERS = int(os.environ.get('PUSH_WORKERS', '8'))
+PUSH_TIMEOUT = int(os.environ.get('PUSH_TIMEOUT', '30'))
+
+# 测速引擎：cloudflarest 使用CloudflareST；builtin 使用内置asyncio探测（从PROBE_CIDR_FILE抽样）
+SPEED_TEST_ENGINE = os.environ.get('SPEED_TEST_ENGINE', 'cloudflarest').lower()
+FULL_SWEEP_SOURCES = ('cloudflarest', 'builtin')
+PROBE_CIDR_FILE = os.environ.get('PROBE_CIDR_FILE', '/app/ip.txt')
+PROBE_PORT = int(os.environ.get('PROBE_PORT', '443'))
+PROBE_MODE = os.environ.get('PROBE_MODE', 'tcp').lower()  # tcp 或 tls
+PROBE_SERVER_NAME = os.environ.get('PROBE_SERVER_NAME', '')
+PROBE_PER_BLOCK = int(os.environ.get('PROBE_PER_BLOCK', '1'))
+PROBE_MAX_IPS = int(os.environ.get('PROBE_MAX_IPS', '5000'))
+PROBE_ATTEMPTS = int(os.environ.get('PROBE_ATTEMPTS', '4'))
+PROBE_TIMEOUT = float(os.environ.get('PROBE_TIMEOUT', '1'))
+PROBE_CONCURRENCY = int(os.environ.get('PROBE_CONCURRENCY', '1000'))
+PROBE_MAX_LOSS = float(os.environ.get('PROBE_MAX_LOSS', '0.25'))
+
+# 按域名优选：以每个域名作为SNI对候选IP做TLS握手探测，为每个域名分别选出最优IP
+PER_DOMAIN_SELECTION = os.environ.get('PER_DOMAIN_SELECTION', 'false').lower() in ('1', 'true', 'yes', 'on')
+PER_DOMAIN_CANDIDATES = int(os.environ.get('PER_DOMAIN_CANDIDATES', '10'))
+PER_DOMAIN_PORT = int(os.environ.get('PER_DOMAIN_PORT', '443'))
+
+# IP质量数据库（保存每次测速所有IP的测量值）
+IP_DB_FILE = os.path.join(DATA_DIR, 'ip_quality.db')
+IP_DB_RETENTION_DAYS = int(os.environ.get('IP_DB_RETENTION_DAYS', '30'))
+ip_db = IPQualityDB(IP_DB_FILE, retention_days=IP_DB_RETENTION_DAYS)
+
+# IP选择方式：latest 使用最近一次测速结果；history 综合最近HISTORY_WINDOW内的历史测量
+IP_SELECTION = os.environ.get('IP_SELECTION', 'latest').lower()
+HISTORY_WINDOW = os.environ.get('HISTORY_WINDOW', '24h')
+HISTORY_MIN_SAMPLES = int(os.environ.get('HISTORY_MIN_SAMPLES', '2'))
+
+# 快速复测：定时任务优先复测历史上表现最好的IP，仅在其劣化或距上次完整测速过久时才运行完整测速
+FAST_REVALIDATE = os.environ.get('FAST_REVALIDATE', 'true').lower() in ('1', 'true', 'yes', 'on')
+REVALIDATE_POOL = int(os.environ.get('REVALIDATE_POOL', '10'))
+REVALIDATE_PORT = int(os.environ.get('REVALIDATE_PORT', '443'))
+REVALIDATE_MAX_LOSS = float(os.environ.get('REVALIDATE_MAX_LOSS', '0.25'))
+REVALIDATE_LATENCY_RATIO = float(os.environ.get('REVALIDATE_LATENCY_RATIO', '1.5'))
+FULL_SWEEP_INTERVAL = os.environ.get('FULL_SWEEP_INTERVAL', '24h')
+
+# Docker Engine API客户端（通过/var/run/docker.sock复用长连接）
+DOCKER_HOST = os.environ.get('DOCKER_HOST', DEFAULT_DOCKER_HOST)
+# 多个Docker节点：逗号分隔的unix://或tcp://地址，可写作 名称=地址；同一份hosts并发推送到所有节点
+DOCKER_HOSTS = os.environ.get('DOCKER_HOSTS', '')
+
+def parse_docker_hosts(text):
+    """解析DOCKER_HOSTS，返回{节点名: 地址}，未指定名称时以去掉协议前缀的地址作为节点名"""
+    nodes = {}
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, sep, url = item.partition('=')
+        if not sep:
+            name, url = item.split('://', 1)[-1], item
+        nodes[name.strip()] = url.strip()
+    return nodes
+
+docker_clients = {name: DockerClient(url, timeout=PUSH_TIMEOUT, pool_size=PUSH_WORKERS,
+                                    on_request=partial(record_docker_request, name))
+                  for name, url in (parse_docker_hosts(DOCKER_HOSTS) or {'local': DOCKER_HOST}).items()}
+DEFAULT_NODE = next(iter(docker_clients))
+docker_client = docker_clients[DEFAULT_NODE]
+
+# 每个节点的运行中容器索引，用于按标签或名称正则选择目标容器
+container_indexes = {node: ContainerIndex(client) for node, client in docker_clients.items()}
+
+@lru_cache(maxsize=32)
+def target_selectors(targets):
+    """解析目标容器配置（元组），返回(容器名列表, 标签/正则选择器列表)"""
+    selectors = parse_selectors(targets)
+    return [s.name for s in selectors if s.is_name], [s for s in selectors if not s.is_name]
+
+def resolve_target_containers(targets, node=None):
+    """把目标容器配置解析为某个节点上的容器名列表
+    
+    直接写出的容器名原样保留；label:key=value 和 re:pattern 选择器在容器索引上匹配运行中的容器。
+    索引由Docker事件维护，未开启事件监听时每次重新列出容器。
+    """
+    try:
+        names, selectors = target_selectors(tuple(targets))
+    except ValueError as e:
+        logger.error(f"目标容器配置有误: {str(e)}")
+        return []
+    if not selectors:
+        return names
+    try:
+        matched = container_indexes[node or DEFAULT_NODE].select(selectors, refresh=not WATCH_DOCKER_EVENTS)
+    except Exception as e:
+        logger.error(f"列出节点 {node or DEFAULT_NODE} 的容器时出错: {str(e)}")
+        matched = []
+    return list(dict.fromkeys(names + matched))
+
+def container_label(container_name, node=None):
+    """日志和页面中显示的容器名，多节点时附带节点名"""
+    if len(docker_clients) > 1:
+        return f"{container_name}@{node or DEFAULT_NODE}"
+    return container_name
 
 def parse_time_interval(interval_str):
     """解析时间间隔字符串为秒数"""
@@ -295,32 +516,74 @@ def parse_time_interval(interval_str):
         logger.warning(f"无效的时间间隔格式: {interval_str}，使用默认值12小时")
         return 12 * 3600
 
-def run_cloudflare_speedtest():
-    """运行CloudflareSpeedTest获取最优IP"""
+# CloudflareST输出中的终端控制序列（颜色、清行等）
+ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;?]*[A-Za-z]')
+
+def _stream_process_output(process, on_output):
+    """逐行读取进程输出（进度条以\\r刷新，同样视为分行），返回最后若干行"""
+    tail = deque(maxlen=20)
+    last_line = None
+    buffer = b''
+    
+    def emit(raw):
+        nonlocal last_line
+        line = ANSI_ESCAPE.sub('', raw.decode('utf-8', errors='replace')).strip()
+        if not line or line == last_line:
+            return
+        last_line = line
+        tail.append(line)
+        logger.debug(f"CloudflareST: {line}")
+        if on_output:
+            on_output(line)
+    
+    for chunk in iter(lambda: process.stdout.read1(4096), b''):
+        buffer += chunk
+        *lines, buffer = re.split(rb'[\r\n]', buffer)
+        for raw in lines:
+            emit(raw)
+    emit(buffer)
+    return list(tail)
+
+def run_cloudflare_speedtest(on_output=None, config=None):
+    """运行CloudflareSpeedTest获取最优IP
+    
+    Args:
+        on_output: 可选回调，CloudflareST每输出一行（含进度刷新）即调用一次
+        config: 配置快照，未提供则读取当前配置
+    """
+    config = config or load_config()
+    speed_test_args = config['SPEED_TEST_ARGS']
+    
     # 如果设置了首选IP，则跳过测速
-    if PREFERRED_IP:
-        logger.info(f"检测到预设首选IP: {PREFERRED_IP}，跳过测速")
+    if config['PREFERRED_IP']:
+        logger.info(f"检测到预设首选IP: {config['PREFERRED_IP']}，跳过测速")
         return True
         
     logger.info("开始运行CloudflareSpeedTest...")
     start_time = time.time()
     
     try:
-        cmd = ['/app/CloudflareST', '-o', SPEEDTEST_RESULT]
-        if SPEED_TEST_ARGS:
-            logger.info(f"使用自定义测速参数: {SPEED_TEST_ARGS}")
-            cmd.extend(SPEED_TEST_ARGS.split())
+        cmd = [CLOUDFLAREST_BIN, '-o', SPEEDTEST_RESULT]
+        if speed_test_args:
+            logger.info(f"使用自定义测速参数: {speed_test_args}")
+            cmd.extend(speed_test_args.split())
         
         logger.info(f"执行命令: {' '.join(cmd)}")
-        process = subprocess.run(cmd, capture_output=True, text=True)
+        # stdin重定向到/dev/null，避免CloudflareST结束时等待回车
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                   stderr=subprocess.STDOUT)
+        with process:
+            tail = _stream_process_output(process, on_output)
+            returncode = process.wait()
         
         elapsed_time = time.time() - start_time
         
-        if process.returncode != 0:
-            logger.error(f"CloudflareSpeedTest运行失败: {process.stderr}")
+        if returncode != 0:
+            logger.error(f"CloudflareSpeedTest运行失败: {' | '.join(tail[-5:])}")
             return False
         
-        logger.info(f"CloudflareSpeedTest运行完成，耗时: {elapsed_time:.2f}秒")
+        logger.info(f"CloudflareSpeedTest运行完成，耗时: {elapsed_time:.2f}秒",
+                    extra={'event': 'speedtest', 'engine': 'cloudflarest', 'duration': round(elapsed_time, 3)})
         
         # 检查结果文件是否存在
         if os.path.exists(SPEEDTEST_RESULT):
@@ -334,20 +597,129 @@ def run_cloudflare_speedtest():
         logger.error(f"运行CloudflareSpeedTest时出错: {str(e)}")
         return False
 
-def get_preferred_ip_results():
+def run_builtin_probe_speedtest(on_output=None):
+    """使用内置asyncio探测引擎测速，结果以CloudflareST格式写入SPEEDTEST_RESULT"""
+    logger.info(f"开始运行内置探测测速（{PROBE_MODE}，端口 {PROBE_PORT}，网段文件 {PROBE_CIDR_FILE}）...")
+    start_time = time.time()
+    last_percent = -1
+    
+    def on_progress(done, total):
+        nonlocal last_percent
+        percent = done * 100 // total
+        if percent // 10 != last_percent // 10 or done == total:
+            last_percent = percent
+            if on_output:
+                on_output(f"已探测 {done}/{total} ({percent}%)")
+    
+    try:
+        ranked = run_builtin_speedtest(
+            PROBE_CIDR_FILE, SPEEDTEST_RESULT, port=PROBE_PORT, per_block=PROBE_PER_BLOCK,
+            max_ips=PROBE_MAX_IPS, attempts=PROBE_ATTEMPTS, timeout=PROBE_TIMEOUT,
+            concurrency=PROBE_CONCURRENCY, mode=PROBE_MODE, server_name=PROBE_SERVER_NAME or None,
+            max_loss=PROBE_MAX_LOSS, on_progress=on_progress)
+    except Exception as e:
+        logger.error(f"运行内置探测测速时出错: {str(e)}")
+        return False
+    
+    elapsed_time = time.time() - start_time
+    logger.info(f"内置探测测速完成，耗时: {elapsed_time:.2f}秒，可用IP: {len(ranked)} 个",
+                extra={'event': 'speedtest', 'engine': 'builtin', 'duration': round(elapsed_time, 3),
+                       'count': len(ranked)})
+    if not ranked:
+        logger.warning("内置探测未发现可用IP")
+        return False
+    return True
+
+def run_speedtest(on_output=None, config=None):
+    """按SPEED_TEST_ENGINE选择测速引擎运行完整测速"""
+    config = config or load_config()
+    if config['PREFERRED_IP']:
+        return run_cloudflare_speedtest(on_output=on_output, config=config)
+    
+    engine = 'builtin' if SPEED_TEST_ENGINE == 'builtin' else 'cloudflarest'
+    start_time = time.time()
+    if engine == 'builtin':
+        successful = run_builtin_probe_speedtest(on_output=on_output)
+    else:
+        successful = run_cloudflare_speedtest(on_output=on_output, config=config)
+    SPEEDTEST_DURATION.observe(time.time() - start_time, engine=engine)
+    SPEEDTESTS.inc(engine=engine, result='success' if successful else 'failure')
+    return successful
+
+# CloudflareST结果文件列名（去除空格并转小写后）与记录字段的对应关系
+RESULT_COLUMNS = {
+    'ip地址': 'ip',
+    'ipaddress': 'ip',
+    '已发送': 'sent',
+    'sent': 'sent',
+    '已接收': 'received',
+    'received': 'received',
+    '丢包率': 'loss_rate',
+    'loss': 'loss_rate',
+    '平均延迟': 'latency',
+    'averagelatency': 'latency',
+    '下载速度(mb/s)': 'download_speed',
+    'downloadspeed(mb/s)': 'download_speed',
+    '地区码': 'colo',
+    'colo': 'colo',
+}
+
+def _to_number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return cast(0)
+
+def iter_speedtest_results(path=None):
+    """逐行解析CloudflareST结果文件，按表头名称定位列，生成SpeedTestRecord
+    
+    只在迭代时按需读取文件，调用方可随时停止而无需读取剩余行。
+    """
+    path = path or SPEEDTEST_RESULT
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return
+        
+        columns = {}
+        for index, name in enumerate(header):
+            field = RESULT_COLUMNS.get(name.replace(' ', '').lower())
+            if field and field not in columns:
+                columns[field] = index
+        if 'ip' not in columns or 'latency' not in columns:
+            raise ValueError(f"CSV格式错误，未找到必要的列: {header}")
+        
+        for row in reader:
+            if len(row) <= columns['ip'] or not row[columns['ip']].strip():
+                continue
+            values = {field: row[index].strip() for field, index in columns.items() if index < len(row)}
+            yield SpeedTestRecord(
+                ip=values['ip'],
+                sent=_to_number(values.get('sent'), int),
+                received=_to_number(values.get('received'), int),
+                loss_rate=_to_number(values.get('loss_rate')),
+                latency=_to_number(values.get('latency')),
+                download_speed=_to_number(values.get('download_speed')),
+                colo=values.get('colo', ''),
+            )
+
+def get_preferred_ip_results(config=None):
     """获取预设首选IP的结果"""
-    if not PREFERRED_IP:
+    preferred_ip = (config or load_config())['PREFERRED_IP']
+    if not preferred_ip:
         return []
         
-    logger.info(f"使用预设首选IP: {PREFERRED_IP}")
-    return [{'ip': PREFERRED_IP, 'speed': '0'}]  # 速度值设为0，表示预设值
+    logger.info(f"使用预设首选IP: {preferred_ip}")
+    return [SpeedTestRecord(ip=preferred_ip)]  # 延迟为0，表示预设值
 
-def parse_speedtest_results():
-    """解析CloudflareSpeedTest结果"""
+def parse_speedtest_results(limit=None, config=None):
+    """解析CloudflareSpeedTest结果，只读取排名前limit（默认IP_COUNT）的行"""
+    config = config or load_config()
     # 如果设置了首选IP，则直接返回首选IP
-    if PREFERRED_IP:
-        logger.info(f"使用预设首选IP: {PREFERRED_IP} (跳过结果解析)")
-        return get_preferred_ip_results()
+    if config['PREFERRED_IP']:
+        logger.info(f"使用预设首选IP: {config['PREFERRED_IP']} (跳过结果解析)")
+        return get_preferred_ip_results(config)
         
     if not os.path.exists(SPEEDTEST_RESULT):
         logger.error(f"结果文件不存在: {SPEEDTEST_RESULT}")
@@ -356,83 +728,108 @@ def parse_speedtest_results():
     try:
         logger.info(f"开始解析测速结果文件: {SPEEDTEST_RESULT}")
         
-        # 读取CSV结果文件
-        with open(SPEEDTEST_RESULT, 'r') as f:
-            lines = f.readlines()
-        
-        logger.info(f"结果文件包含 {len(lines)} 行数据")
+        max_ips = limit or config['IP_COUNT']
+        logger.info(f"当前配置的IP数量上限: {max_ips}")
+        with PARSE_DURATION.time():
+            results = list(islice(iter_speedtest_results(), max_ips))
         
-        if len(lines) <= 1:  # 只有标题行或者空文件
+        if not results:
             logger.warning("测速结果为空，仅包含标题行或文件为空")
             return []
         
-        # 解析CSV（简单实现，可以使用csv模块增强）
-        header = lines[0].strip().split(',')
-        logger.debug(f"CSV标题: {header}")
-        
-        try:
-            ip_index = header.index('IP 地址')
-            speed_index = header.index('平均延迟')
-        except ValueError as e:
-            logger.error(f"CSV格式错误，未找到必要的列: {str(e)}")
-            return []
-        
-        # 获取IP数量配置
-        logger.info(f"当前配置的IP数量上限: {IP_COUNT}")
-        max_ips = min(len(lines) - 1, IP_COUNT)  # 确保不会超过文件中的实际IP数量
-        
-        results = []
-        for i in range(1, max_ips + 1):
-            fields = lines[i].strip().split(',')
-            if len(fields) > max(ip_index, speed_index):
-                ip = fields[ip_index]
-                speed = fields[speed_index]
-                results.append({
-                    'ip': ip,
-                    'speed': speed,
-                })
-                logger.debug(f"添加IP: {ip}, 速度: {speed}ms")
-        
+        for record in results:
+            logger.debug(f"添加IP: {record.ip}, 延迟: {record.latency}ms, 丢包率: {record.loss_rate}, "
+                         f"下载速度: {record.download_speed}MB/s, 地区码: {record.colo}")
         logger.info(f"成功解析 {len(results)}/{max_ips} 个IP地址")
         
-        if len(results) > 0:
-            # 记录最快的IP和延迟
-            fastest_ip = results[0]['ip']
-            fastest_speed = results[0]['speed']
-            logger.info(f"最优IP: {fastest_ip}, 延迟: {fastest_speed}ms")
-        
+        # 记录最快的IP和延迟
+        logger.info(f"最优IP: {results[0].ip}, 延迟: {results[0].latency}ms",
+                    extra={'event': 'ip_selected', 'ip': results[0].ip, 'latency': results[0].latency})
         return results
     except Exception as e:
         logger.error(f"解析结果时出错: {str(e)}")
         return []
 
-def generate_hosts_content(ip_list, domains=None):
-    """生成hosts文件内容
+def record_speedtest_results(source='cloudflarest'):
+    """将本次测速结果文件中的所有IP写入IP质量数据库"""
+    try:
+        count = ip_db.record_run(iter_speedtest_results(), source=source)
+        logger.info(f"已记录 {count} 个IP的测速数据到IP质量数据库")
+        return count
+    except Exception as e:
+        logger.error(f"记录测速数据失败: {str(e)}")
+        return 0
+
+def select_ips_from_history(limit):
+    """根据历史测量选出综合表现最好的IP"""
+    try:
+        stats = ip_db.best_ips(since_seconds=parse_time_interval(HISTORY_WINDOW), limit=limit,
+                               min_samples=HISTORY_MIN_SAMPLES)
+    except Exception as e:
+        logger.error(f"查询IP历史数据失败: {str(e)}")
+        return []
+    return [SpeedTestRecord(ip=row['ip'], loss_rate=round(row['avg_loss'] or 0.0, 4),
+                            latency=round(row['avg_latency'] or 0.0, 2),
+                            download_speed=round(row['avg_download'] or 0.0, 2),
+                            colo=row['colo'] or '')
+            for row in stats if row['avg_latency'] is not None]
+
+def select_ips(limit=None, config=None):
+    """按IP_SELECTION选择要写入hosts的IP，历史数据不足时回退到最近一次测速结果"""
+    config = config or load_config()
+    if IP_SELECTION == 'history' and not config['PREFERRED_IP']:
+        ip_list = select_ips_from_history(limit or config['IP_COUNT'])
+        if ip_list:
+            logger.info(f"根据最近 {HISTORY_WINDOW} 的历史测量选出 {len(ip_list)} 个IP，"
+                        f"最优IP: {ip_list[0].ip}, 平均延迟: {ip_list[0].latency}ms")
+            return ip_list
+        logger.info("历史测量数据不足，使用最近一次测速结果")
+    return parse_speedtest_results(limit, config=config)
+
+def revalidate_known_ips(config=None):
+    """快速复测历史上表现最好的IP池
     
-    Args:
-        ip_list: IP地址列表
-        domains: 可选的域名列表，如果提供则优先使用，否则使用全局CF_DOMAINS
+    返回仍然健康的IP列表（按延迟排序，数量不少于IP_COUNT）；
+    若历史数据不足、距上次完整测速超过FULL_SWEEP_INTERVAL或IP池已劣化，返回None，
+    调用方应运行完整测速。
     """
-    if not ip_list:
-        logger.error("无可用IP")
-        return ""
+    config = config or load_config()
+    ip_count = config['IP_COUNT']
+    last_sweep = ip_db.last_run(source=FULL_SWEEP_SOURCES)
+    if not last_sweep:
+        logger.info("没有完整测速记录，需要运行完整测速")
+        return None
+    if time.time() - last_sweep['ts'] > parse_time_interval(FULL_SWEEP_INTERVAL):
+        logger.info(f"距上次完整测速已超过 {FULL_SWEEP_INTERVAL}，需要运行完整测速")
+        return None
     
-    # 使用上海时区获取当前时间
-    now = datetime.now(TIMEZONE)
-    hosts_content = f"{HOSTS_MARKER} - 更新时间: {now.strftime('%Y-%m-%d %H:%M:%S')}\n"
+    pool = ip_db.best_ips(since_seconds=parse_time_interval(FULL_SWEEP_INTERVAL), limit=max(REVALIDATE_POOL, candidate_ip_count(config)))
+    if len(pool) < ip_count:
+        logger.info("历史IP池不足，需要运行完整测速")
+        return None
     
-    # 检查是否有自定义模板
-    template_line = "{ip} {domain} # 速度:{speed}ms"
-    if os.path.exists(HOSTS_TEMPLATE):
-        with open(HOSTS_TEMPLATE, 'r') as f:
-            template_content = f.read().strip()
-            if template_content:
-                template_line = template_content
-    
-    # 确定使用哪个域名列表
-    domain_list = domains if domains is not None else CF_DOMAINS
+    baselines = {row['ip']: row['avg_latency'] or 0.0 for row in pool}
+    logger.info(f"开始快速复测 {len(pool)} 个历史优选IP")
+    start_time = time.time()
+    results = probe_ips(baselines, port=REVALIDATE_PORT)
+    ip_db.record_run(results, source='revalidate')
     
-    # 处理可能存在换行符的域名列表
+    healthy = [r for r in rank_records(results, max_loss=REVALIDATE_MAX_LOSS)
+               if not baselines[r.ip] or r.latency <= baselines[r.ip] * REVALIDATE_LATENCY_RATIO]
+    elapsed_time = time.time() - start_time
+    logger.info(f"快速复测完成，耗时: {elapsed_time:.2f}秒，{len(healthy)}/{len(pool)} 个IP仍然健康",
+                extra={'event': 'revalidate', 'duration': round(elapsed_time, 3), 'count': len(healthy)})
+    if len(healthy) < ip_count:
+        logger.info("历史优选IP已劣化，需要运行完整测速")
+        return None
+    return healthy
+
+def normalize_domains(domain_list):
+    """展开域名列表中以换行或逗号分隔的条目，去除空白和空项（结果按输入缓存）"""
+    return list(_normalize_domains(tuple(domain_list or ())))
+
+@lru_cache(maxsize=32)
+def _normalize_domains(domain_list):
     processed_domains = []
     for domain_entry in domain_list:
         if not domain_entry:
@@ -447,50 +844,167 @@ def generate_hosts_content(ip_list, domains=None):
                 # 然后处理可能的逗号分隔
                 domains = [d.strip() for d in line.split(',') if d.strip()]
                 processed_domains.extend(domains)
-        else:
+        elif domain_entry.strip():
             processed_domains.append(domain_entry.strip())
+    return tuple(processed_domains)
+
+def candidate_ip_count(config=None):
+    """选择阶段需要的候选IP数量：按域名优选时需要更大的候选池"""
+    ip_count = (config or load_config())['IP_COUNT']
+    return max(ip_count, PER_DOMAIN_CANDIDATES) if PER_DOMAIN_SELECTION else ip_count
+
+def _resolve_addresses(domain):
+    try:
+        return frozenset(info[4][0] for info in socket.getaddrinfo(domain, 443, proto=socket.IPPROTO_TCP))
+    except OSError:
+        return None
+
+def group_domains_by_pool(domains):
+    """按公网解析结果分组：解析到同一组地址的域名共享一次探测"""
+    with ThreadPoolExecutor(max_workers=min(16, max(1, len(domains))), thread_name_prefix='resolve') as executor:
+        resolved = list(executor.map(_resolve_addresses, domains))
+    groups = {}
+    for domain, addresses in zip(domains, resolved):
+        # 无法解析的域名单独成组
+        groups.setdefault(addresses or domain, []).append(domain)
+    return list(groups.values())
+
+def build_ip_table(candidates, domains=None, config=None):
+    """生成 域名 -> 排序后的IP列表 的对照表
+    
+    未开启按域名优选时，所有域名使用同一组前IP_COUNT个候选IP；
+    开启后按解析结果把域名分组，以组内第一个域名作为SNI对候选IP探测，为各组分别排序，
+    探测不到可用IP的组回退到全局候选。
+    """
+    config = config or load_config()
+    ip_count = config['IP_COUNT']
+    domain_list = normalize_domains(domains if domains is not None else config['CF_DOMAINS'])
+    default_ips = list(candidates[:ip_count])
+    if not PER_DOMAIN_SELECTION or config['PREFERRED_IP'] or not domain_list or not candidates:
+        return {domain: default_ips for domain in domain_list}
+    
+    groups = group_domains_by_pool(domain_list)
+    representatives = [group[0] for group in groups]
+    logger.info(f"按域名优选：{len(domain_list)} 个域名分为 {len(groups)} 组，探测 {len(candidates)} 个候选IP")
+    start_time = time.time()
+    results = probe_server_names([c.ip for c in candidates], representatives, port=PER_DOMAIN_PORT,
+                                 concurrency=PROBE_CONCURRENCY)
+    
+    ip_table = {}
+    for group, representative in zip(groups, representatives):
+        ranked = rank_records(results[representative], max_loss=PROBE_MAX_LOSS)[:ip_count]
+        if not ranked:
+            logger.warning(f"域名 {representative} 没有探测到可用IP，使用全局优选结果")
+            ranked = default_ips
+        for domain in group:
+            ip_table[domain] = ranked
+    logger.info(f"按域名优选完成，耗时: {time.time() - start_time:.2f}秒")
+    # 保持配置中的域名顺序
+    return {domain: ip_table[domain] for domain in domain_list}
+
+def generate_hosts_content(ip_table, domains=None):
+    """生成hosts文件内容
     
-    logger.info(f"处理后的域名列表: {processed_domains}")
+    Args:
+        ip_table: 域名到IP列表的对照表（build_ip_table的结果），
+                  也可以是所有域名共用的IP列表
+        domains: 可选的域名列表，ip_table为列表时使用，未提供则使用当前配置的CF_DOMAINS
+    """
+    if not isinstance(ip_table, dict):
+        if domains is None:
+            domains = load_config()['CF_DOMAINS']
+        ip_table = {domain: list(ip_table or []) for domain in normalize_domains(domains)}
+    if not any(ip_table.values()):
+        logger.error("无可用IP")
+        return ""
+    
+    # 使用上海时区获取当前时间
+    now = datetime.now(TIMEZONE)
+    logger.info(f"处理后的域名列表: {list(ip_table)}")
     
-    # 为每个域名生成hosts条目
-    for domain in processed_domains:
-        if not domain:
+    # 模板只在文件变化时重新解析，条目一次性渲染
+    return ''.join([
+        f"{HOSTS_MARKER} - 更新时间: {now.strftime('%Y-%m-%d %H:%M:%S')}\n",
+        hosts_template.render(ip_table),
+        f"{HOSTS_MARKER} - 结束\n",
+    ])
+
+def parse_hosts_ips(content):
+    """从hosts内容中提取 域名 -> IP（同一域名有多个IP时取最后一个）"""
+    ips = {}
+    for line in content.splitlines():
+        # 跳过注释行或空行
+        if not line or line.startswith('#'):
             continue
         
-        for ip_info in ip_list:
-            line = template_line.format(
-                ip=ip_info['ip'],
-                domain=domain,
-                speed=ip_info['speed']
-            )
-            hosts_content += line + "\n"
+        # 必须包含IP地址（第一部分）和域名（第二部分）
+        parts = line.split()
+        if len(parts) >= 2:
+            ip, domain = parts[0], parts[1]
+            # 验证IP格式（简单检查）
+            if all(part.isdigit() for part in ip.split('.')):
+                ips[domain] = ip
+    return ips
+
+def backup_max_age_seconds():
+    """备份最长保留时间（秒），未配置时返回None"""
+    return parse_time_interval(HOSTS_BACKUP_MAX_AGE) if HOSTS_BACKUP_MAX_AGE else None
+
+def prune_backups(path, keep, max_age=None):
+    """按环形缓冲策略清理 path.bak.<时间戳> 备份：只保留最新keep份，并删除超过max_age秒的备份"""
+    directory = os.path.dirname(path) or '.'
+    prefix = f"{os.path.basename(path)}.bak."
+    backups = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            suffix = entry.name[len(prefix):]
+            if entry.name.startswith(prefix) and suffix.isdigit():
+                backups.append((int(suffix), entry.path))
+    backups.sort(reverse=True)
     
-    hosts_content += f"{HOSTS_MARKER} - 结束\n"
-    return hosts_content
+    cutoff = time.time() - max_age if max_age else None
+    removed = 0
+    for index, (timestamp, backup_path) in enumerate(backups):
+        if index >= keep or (cutoff is not None and timestamp < cutoff):
+            try:
+                os.remove(backup_path)
+                removed += 1
+            except OSError as e:
+                logger.warning(f"删除旧备份 {backup_path} 失败: {str(e)}")
+    if removed:
+        logger.info(f"已清理 {removed} 个旧hosts备份")
+    return removed
 
 def save_hosts_file(content):
     """保存hosts文件"""
     try:
         logger.info(f"准备保存hosts文件到: {HOSTS_FILE}")
         
-        # 先备份现有hosts文件（如果存在）
+        # 先备份现有hosts文件（如果存在且管理的条目有变化）
         if os.path.exists(HOSTS_FILE):
-            backup_path = f"{HOSTS_FILE}.bak.{int(time.time())}"
-            try:
-                import shutil
-                shutil.copy2(HOSTS_FILE, backup_path)
-                logger.info(f"已备份原hosts文件到: {backup_path}")
-            except Exception as backup_err:
-                logger.warning(f"备份hosts文件失败: {str(backup_err)}")
-        
-        # 保存新的hosts文件
-        with open(HOSTS_FILE, 'w') as f:
-            f.write(content)
+            with open(HOSTS_FILE, 'r') as f:
+                previous = f.read()
+            if hosts_block_digest(previous) != hosts_block_digest(content):
+                backup_path = f"{HOSTS_FILE}.bak.{int(time.time())}"
+                try:
+                    # 原文件即将被rename替换，直接硬链接作为备份，无需复制
+                    try:
+                        os.link(HOSTS_FILE, backup_path)
+                    except OSError:
+                        shutil.copy2(HOSTS_FILE, backup_path)
+                    logger.info(f"已备份原hosts文件到: {backup_path}")
+                    prune_backups(HOSTS_FILE, HOSTS_BACKUP_KEEP, backup_max_age_seconds())
+                except Exception as backup_err:
+                    logger.warning(f"备份hosts文件失败: {str(backup_err)}")
+        
+        # 原子保存新的hosts文件
+        atomic_write(HOSTS_FILE, content)
+        event_bus.publish('ips', parse_hosts_ips(content))
             
         # 验证文件写入
         if os.path.exists(HOSTS_FILE):
             file_size = os.path.getsize(HOSTS_FILE)
-            logger.info(f"hosts文件已保存，大小: {file_size}字节")
+            logger.info(f"hosts文件已保存，大小: {file_size}字节", extra={'event': 'hosts_saved'})
             
             # 计算hosts条目数
             entry_count = 0
@@ -510,86 +1024,335 @@ def save_hosts_file(content):
         logger.error(f"保存hosts文件失败: {str(e)}")
         return False
 
-def update_container_hosts(container_name, hosts_content):
-    """更新容器的hosts文件"""
-    logger.info(f"正在更新容器 {container_name} 的hosts文件")
+def _remaining(deadline):
+    """计算距离截止时间的剩余秒数（至少1秒）"""
+    return max(1, deadline - time.time())
+
+# 容器内hosts文件不存在系统条目时使用的基本配置
+DEFAULT_SYSTEM_HOSTS = [
+    '127.0.0.1\tlocalhost',
+    '::1\tlocalhost ip6-localhost ip6-loopback',
+    'fe00::0\tip6-localnet',
+    'ff00::0\tip6-mcastprefix',
+    'ff02::1\tip6-allnodes',
+    'ff02::2\tip6-allrouters',
+]
+
+# 不支持通过归档接口覆盖/etc/hosts的(节点, 容器)（/etc/hosts为bind mount时Docker会拒绝解包）
+_ARCHIVE_WRITE_UNSUPPORTED = set()
+
+# /etc/hosts为bind mount时Docker拒绝解包的错误信息（unlinkat /etc/hosts: device or resource busy）
+BIND_MOUNT_REFUSAL = 'device or resource busy'
+
+def strip_managed_section(content):
+    """移除hosts内容中由本程序管理的区块，返回剩余的非空系统条目行"""
+    end_marker = f"{HOSTS_MARKER} - 结束"
+    system_lines = []
+    in_section = False
+    for line in content.splitlines():
+        stripped = line.strip()
+        if stripped.startswith(end_marker):
+            in_section = False
+            continue
+        if stripped.startswith(HOSTS_MARKER):
+            in_section = True
+            continue
+        if not in_section and stripped:
+            system_lines.append(line)
+    return system_lines
+
+def extract_managed_section(content):
+    """提取hosts内容中由本程序管理的区块条目（不含首尾标记行，因此忽略更新时间）"""
+    end_marker = f"{HOSTS_MARKER} - 结束"
+    entries = []
+    in_section = False
+    for line in content.splitlines():
+        stripped = line.strip()
+        if stripped.startswith(end_marker):
+            in_section = False
+            continue
+        if stripped.startswith(HOSTS_MARKER):
+            in_section = True
+            continue
+        if in_section:
+            entries.append(line.rstrip())
+    return entries
+
+def hosts_block_digest(content):
+    """计算管理区块的摘要，用于判断容器中的hosts是否已是最新
+    
+    对去掉注释并合并空白后的条目行计算，忽略模板注释（如每次测速都会变化的延迟），
+    条目（IP、域名、别名等）没有变化时摘要相同
+    """
+    entries = []
+    for line in extract_managed_section(content):
+        fields = line.split('#', 1)[0].split()
+        if fields:
+            entries.append(' '.join(fields))
+    return hashlib.sha256('\n'.join(entries).encode('utf-8')).hexdigest()
+
+def merge_hosts_content(current_content, hosts_content):
+    """将新的管理区块合并到容器现有hosts内容中：管理区块在顶部，系统条目在底部"""
+    system_lines = strip_managed_section(current_content) or DEFAULT_SYSTEM_HOSTS
+    return hosts_content.rstrip('\n') + '\n\n' + '\n'.join(system_lines) + '\n'
+
+def read_container_hosts(container_name, timeout=None, node=None):
+    """通过归档接口读取容器的/etc/hosts，返回(内容, tar成员信息)"""
+    data = docker_clients[node or DEFAULT_NODE].get_archive(container_name, '/etc/hosts', timeout=timeout)
+    with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+        member = tar.next()
+        content = tar.extractfile(member).read().decode('utf-8', errors='replace')
+    return content, member
+
+def _build_hosts_archive(files, template_member):
+    """打包要写入/etc的文件，沿用原hosts文件的权限和属主"""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w') as tar:
+        for name, content in files:
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mode = template_member.mode
+            info.uid = template_member.uid
+            info.gid = template_member.gid
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+    return buffer.getvalue()
+
+# 清理容器内多余的hosts备份：按时间戳从新到旧，超过保留份数或早于截止时间的删除
+# 参数: $1=保留份数 $2=截止时间戳（0表示不按时间清理）
+PRUNE_CONTAINER_BACKUPS = (
+    'keep=$1; cutoff=$2; i=0; '
+    'for f in $(ls -1 /etc/hosts.bak.* 2>/dev/null | sort -r); do '
+    'ts=${f##*.}; case "$ts" in ""|*[!0-9]*) continue;; esac; i=$((i+1)); '
+    'if [ "$i" -gt "$keep" ] || [ "$ts" -lt "$cutoff" ]; then rm -f "$f"; fi; '
+    'done'
+)
+
+def _container_prune_args():
+    max_age = backup_max_age_seconds()
+    cutoff = int(time.time() - max_age) if max_age else 0
+    return [str(CONTAINER_BACKUP_KEEP), str(cutoff)]
+
+def write_container_hosts(container_name, new_content, backup_content, member, timeout=None, node=None):
+    """将合并后的hosts写回容器，保留一份带时间戳的备份，并清理超出保留策略的旧备份
+    
+    优先使用一次归档上传完成；若守护进程拒绝覆盖（bind mount），
+    则退化为一次exec，通过stdin写入，无需在容器内生成脚本或临时文件。
+    bind mount的/etc/hosts无法被rename替换，只能原地覆盖写入。
+    """
+    client = docker_clients[node or DEFAULT_NODE]
+    label = container_label(container_name, node)
+    backup_name = f"hosts.bak.{int(time.time())}"
+    if (node or DEFAULT_NODE, container_name) not in _ARCHIVE_WRITE_UNSUPPORTED:
+        archive = _build_hosts_archive([(backup_name, backup_content), ('hosts', new_content)], member)
+        try:
+            client.put_archive(container_name, '/etc', archive, timeout=timeout)
+        except DockerAPIError as e:
+            # 只记住bind mount导致的拒绝；其他错误（容器暂停、守护进程错误等）本次推送失败，下次重试
+            if BIND_MOUNT_REFUSAL not in str(e.message).lower():
+                raise
+            logger.info(f"容器 {label} 不支持通过归档接口覆盖hosts（{e.message}），改用exec写入")
+            _ARCHIVE_WRITE_UNSUPPORTED.add((node or DEFAULT_NODE, container_name))
+        else:
+            try:
+                exit_code, _, stderr = client.exec_run(
+                    container_name, ['sh', '-c', PRUNE_CONTAINER_BACKUPS, 'sh'] + _container_prune_args(),
+                    timeout=timeout)
+                if exit_code != 0:
+                    logger.warning(f"清理容器 {label} 的旧hosts备份失败: "
+                                   f"{stderr.decode('utf-8', errors='replace').strip()}")
+            except Exception as e:
+                logger.warning(f"清理容器 {label} 的旧hosts备份失败: {str(e)}")
+            return
+    
+    # 备份、写入和清理在同一次exec中完成；清理失败不影响写入结果
+    script = f'cp /etc/hosts "$1" && cat > /etc/hosts && {{ shift; {PRUNE_CONTAINER_BACKUPS}; true; }}'
+    cmd = ['sh', '-c', script, 'sh', f"/etc/{backup_name}"] + _container_prune_args()
+    exit_code, _, stderr = client.exec_run(container_name, cmd, stdin=new_content.encode('utf-8'),
+                                           timeout=timeout)
+    if exit_code != 0:
+        raise DockerAPIError(exit_code, stderr.decode('utf-8', errors='replace').strip())
+
+def push_container_hosts(container_name, hosts_content, timeout=None, digest=None, node=None):
+    """更新容器的hosts文件，返回 'updated'、'unchanged' 或 'failed'
+    
+    读取一次容器的/etc/hosts，若管理区块与新内容一致则跳过写入；
+    否则在本地合并管理区块后一次写回。
+    
+    Args:
+        container_name: 容器名称
+        hosts_content: 要写入的hosts内容
+        timeout: 单个容器的总超时秒数，默认使用PUSH_TIMEOUT
+        digest: hosts_content管理区块的摘要，批量推送时预先计算以避免重复哈希
+        node: Docker节点名，默认为第一个节点
+    """
+    start_time = time.time()
+    deadline = start_time + (timeout or PUSH_TIMEOUT)
+    digest = digest or hosts_block_digest(hosts_content)
+    label = container_label(container_name, node)
+    
+    def fields(status):
+        return {'event': 'container_push', 'container': container_name, 'node': node or DEFAULT_NODE,
+                'status': status, 'duration': round(time.time() - start_time, 3)}
     
     try:
-        # 检查容器是否存在
-        check_cmd = ["docker", "inspect", container_name]
-        check_process = subprocess.run(check_cmd, capture_output=True)
-        if check_process.returncode != 0:
-            logger.error(f"容器 {container_name} 不存在")
-            return False
-        
-        # 备份原hosts文件
-        backup_cmd = f"docker exec {container_name} sh -c 'cp /etc/hosts /etc/hosts.bak'"
-        subprocess.run(backup_cmd, shell=True, check=True)
-        
-        # 使用更可靠的方法更新hosts文件
-        # 完全重写hosts文件，保持我们的Cloudflare IP在顶部，系统原始条目在底部
-        
-        # 使用硬编码标记，确保一致性
-        escaped_marker = HOSTS_MARKER.replace('/', '\\/').replace('&', '\\&').replace('.', '\\.').replace('*', '\\*')
-        
-        update_cmd = f"""
-        docker exec {container_name} sh -c "
-        # 完全重写hosts文件的更可靠方法
-        
-        # 1. 备份原hosts文件（再次确保备份）
-        cp /etc/hosts /etc/hosts.bak.$(date +%s)
-        
-        # 2. 提取系统默认hosts（过滤掉所有我们添加的标记行及其间的内容）
-        # 使用awk进行精确过滤：不输出带有我们标记的行以及标记之间的所有行
-        awk '
-          BEGIN {{ in_section = 0; }}
-          /^[ \\t]*{escaped_marker}/ {{ in_section = 1; next; }}
-          /^[ \\t]*{escaped_marker} - 结束/ {{ in_section = 0; next; }}
-          !in_section {{ print; }}
-        ' /etc/hosts > /tmp/system_hosts.tmp
-        
-        # 3. 从系统hosts中进一步过滤：只过滤空行，保留系统注释
-        grep -v '^$' /tmp/system_hosts.tmp > /tmp/system_hosts
-        
-        # 4. 如果系统hosts为空，则使用基本localhost配置
-        if [ ! -s /tmp/system_hosts ]; then
-            echo '127.0.0.1\tlocalhost' > /tmp/system_hosts
-            echo '::1\tlocalhost ip6-localhost ip6-loopback' >> /tmp/system_hosts
-            echo 'fe00::0\tip6-localnet' >> /tmp/system_hosts
-            echo 'ff00::0\tip6-mcastprefix' >> /tmp/system_hosts
-            echo 'ff02::1\tip6-allnodes' >> /tmp/system_hosts
-            echo 'ff02::2\tip6-allrouters' >> /tmp/system_hosts
-        fi
-        
-        # 5. 创建新的hosts文件：我们的内容 + 系统默认内容
-        echo '{hosts_content}' > /tmp/hosts.new
-        echo '' >> /tmp/hosts.new  # 添加空行分隔
-        cat /tmp/system_hosts >> /tmp/hosts.new
-        cat /tmp/hosts.new > /etc/hosts
-        
-        # 6. 清理临时文件
-        rm -f /tmp/hosts.new /tmp/system_hosts /tmp/system_hosts.tmp
-        
-        # 7. 显示更新后的hosts文件内容（用于调试）
-        echo '=== 更新后的hosts文件内容 ==='
-        cat /etc/hosts
-        echo '=== hosts文件内容结束 ==='
-        "
-        """
-        process = subprocess.run(update_cmd, shell=True, capture_output=True, text=True)
-        
-        if process.returncode != 0:
-            logger.error(f"更新容器 {container_name} 的hosts文件失败: {process.stderr}")
+        try:
+            current_content, member = read_container_hosts(container_name, timeout=_remaining(deadline), node=node)
+        except DockerAPIError as e:
+            if e.status == 404:
+                logger.error(f"容器 {label} 不存在", extra=fields('failed'))
+                return 'failed'
+            raise
+        
+        if hosts_block_digest(current_content) == digest:
+            logger.info(f"容器 {label} 的hosts已是最新，跳过写入", extra=fields('unchanged'))
+            return 'unchanged'
+        
+        logger.info(f"正在更新容器 {label} 的hosts文件")
+        new_content = merge_hosts_content(current_content, hosts_content)
+        write_container_hosts(container_name, new_content, current_content, member,
+                              timeout=_remaining(deadline), node=node)
+        
+        logger.info(f"容器 {label} 的hosts文件已更新", extra=fields('updated'))
+        return 'updated'
+    except socket.timeout:
+        logger.error(f"更新容器 {label} 的hosts文件超时", extra=fields('failed'))
+        return 'failed'
+    except Exception as e:
+        logger.error(f"更新容器 {label} 的hosts文件时出错: {str(e)}", extra=fields('failed'))
+        return 'failed'
+
+def update_container_hosts(container_name, hosts_content, timeout=None, node=None):
+    """更新容器的hosts文件，管理区块未变化时视为成功"""
+    return push_container_hosts(container_name, hosts_content, timeout=timeout, node=node) != 'failed'
+
+def update_containers_hosts(containers, hosts_content, max_workers=None, timeout=None, nodes=None):
+    """并发更新多个容器的hosts文件，配置了多个Docker节点时推送到每个节点上的同名容器
+    
+    Args:
+        containers: 容器名称或选择器列表（见resolve_target_containers）
+        hosts_content: 要写入的hosts内容
+        max_workers: 最大并发数，默认使用PUSH_WORKERS
+        timeout: 单个容器的超时秒数，默认使用PUSH_TIMEOUT
+        nodes: 要推送的Docker节点名列表，默认为全部节点
+    
+    Returns:
+        汇总结果字典: {'total', 'success', 'unchanged', 'failed', 'elapsed',
+                      'results': {容器名: {'success', 'status', 'elapsed', 'node', 'container'}},
+                      'nodes': {节点名: {'total', 'success', 'unchanged', 'failed'}}}
+        其中success包含已是最新而跳过写入的容器，unchanged单独计数；多节点时容器名为 容器@节点
+    """
+    nodes = [n for n in dict.fromkeys(nodes or docker_clients) if n in docker_clients]
+    resolved = {node: resolve_target_containers(containers or [], node) for node in nodes}
+    targets = [(node, container) for node in nodes for container in resolved[node]]
+    report = {'total': len(targets), 'success': 0, 'unchanged': 0, 'failed': 0, 'elapsed': 0.0, 'results': {},
+              'nodes': {node: {'total': len(resolved[node]), 'success': 0, 'unchanged': 0, 'failed': 0}
+                        for node in nodes}}
+    if not targets:
+        logger.info("未配置目标容器，跳过容器hosts更新")
+        return report
+    
+    workers = max(1, min(max_workers or PUSH_WORKERS, len(targets)))
+    if len(docker_clients) > 1:
+        logger.info(f"开始更新 {len(nodes)} 个节点上 {len(targets)} 个容器的hosts文件，并发数: {workers}")
+    else:
+        logger.info(f"开始更新 {len(targets)} 个容器的hosts文件，并发数: {workers}")
+    start_time = time.time()
+    digest = hosts_block_digest(hosts_content)
+    
+    def push(node, container):
+        push_start = time.time()
+        status = push_container_hosts(container, hosts_content, timeout=timeout, digest=digest, node=node)
+        elapsed = time.time() - push_start
+        PUSH_DURATION.observe(elapsed, node=node)
+        CONTAINER_PUSHES.inc(node=node, status=status)
+        return status, elapsed
+    
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hosts-push') as executor:
+        futures = {executor.submit(push, node, container): (node, container) for node, container in targets}
+        for future in as_completed(futures):
+            node, container = futures[future]
+            label = container_label(container, node)
+            try:
+                status, elapsed = future.result()
+            except Exception as e:
+                logger.error(f"更新容器 {label} 的hosts文件时出错: {str(e)}")
+                status, elapsed = 'failed', time.time() - start_time
+            ok = status != 'failed'
+            report['results'][label] = {'success': ok, 'status': status, 'elapsed': round(elapsed, 3),
+                                        'node': node, 'container': container}
+            for summary in (report, report['nodes'][node]):
+                summary['success' if ok else 'failed'] += 1
+                if status == 'unchanged':
+                    summary['unchanged'] += 1
+    
+    report['elapsed'] = round(time.time() - start_time, 3)
+    logger.info(f"容器hosts更新完成: {report['success']}/{report['total']} 个成功"
+                f"（{report['unchanged']} 个无变化跳过），耗时: {report['elapsed']:.2f}秒",
+                extra={'event': 'containers_updated', 'duration': report['elapsed'], 'count': report['total'],
+                       'failed': report['failed']})
+    if len(docker_clients) > 1:
+        for node, summary in report['nodes'].items():
+            logger.info(f"节点 {node}: {summary['success']}/{summary['total']} 个成功"
+                        f"（{summary['unchanged']} 个无变化跳过）")
+    failed = [name for name, result in report['results'].items() if not result['success']]
+    if failed:
+        logger.warning(f"以下容器hosts更新失败: {', '.join(failed)}")
+    event_bus.publish('containers', report)
+    return report
+
+# 监听容器启动事件：Docker在容器启动/重启时会重写其/etc/hosts，此时立即重新写入已保存的hosts，无需重新测速
+WATCH_DOCKER_EVENTS = os.environ.get('WATCH_DOCKER_EVENTS', 'true').lower() in ('1', 'true', 'yes', 'on')
+WATCH_RETRY_DELAY = int(os.environ.get('WATCH_RETRY_DELAY', '5'))
+reapply_executor = ThreadPoolExecutor(max_workers=PUSH_WORKERS, thread_name_prefix='hosts-reapply')
+reapply_pending = set()
+reapply_lock = threading.Lock()
+
+def reapply_container_hosts(node, container_name):
+    """把已保存的hosts文件重新写入单个节点上的单个容器"""
+    label = container_label(container_name, node)
+    with reapply_lock:
+        reapply_pending.discard((node, container_name))
+    try:
+        if not os.path.exists(HOSTS_FILE):
+            logger.info(f"尚未生成hosts文件，跳过容器 {label} 的hosts更新")
             return False
-        
-        logger.info(f"容器 {container_name} 的hosts文件已更新")
-        return True
+        with open(HOSTS_FILE, 'r', encoding='utf-8') as f:
+            hosts_content = f.read()
+        return update_containers_hosts([container_name], hosts_content, nodes=[node])['failed'] == 0
     except Exception as e:
-        logger.error(f"更新容器 {container_name} 的hosts文件时出错: {str(e)}")
+        logger.error(f"重新写入容器 {label} 的hosts文件时出错: {str(e)}")
         return False
 
-def save_update_history(ip_list, is_scheduled):
-    """记录更新历史"""
+def on_container_event(node, container_name, event):
+    """容器事件回调：更新容器索引；目标容器启动时重新写入hosts，同一容器排队中的重复事件合并为一次"""
+    container_indexes[node].apply_event(event)
+    if event.get('Action') != 'start':
+        return
+    try:
+        names, selectors = target_selectors(tuple(load_config()['TARGET_CONTAINERS']))
+    except ValueError:
+        return
+    _, labels = event_labels(event)
+    if container_name not in names and not any(s.matches(container_name, labels) for s in selectors):
+        return
+    with reapply_lock:
+        if (node, container_name) in reapply_pending:
+            return
+        reapply_pending.add((node, container_name))
+    logger.info(f"检测到目标容器 {container_label(container_name, node)} 已启动，重新写入hosts",
+                extra={'event': 'container_started', 'container': container_name, 'node': node})
+    reapply_executor.submit(reapply_container_hosts, node, container_name)
+
+# 每个Docker节点一个监听线程，事件流断开期间索引可能过期，断开后标记为失效
+container_watchers = [ContainerEventWatcher(client, partial(on_container_event, node), logger,
+                                            actions=INDEX_ACTIONS, retry_delay=WATCH_RETRY_DELAY,
+                                            on_disconnect=container_indexes[node].invalidate)
+                      for node, client in docker_clients.items()]
+
+def save_update_history(ip_table, is_scheduled):
+    """记录更新历史（域名 -> 实际写入的IP）"""
     try:
         # 确保数据目录存在
         os.makedirs(os.path.dirname(UPDATE_HISTORY_FILE), exist_ok=True)
@@ -598,17 +1361,10 @@ def save_update_history(ip_list, is_scheduled):
         current_time = datetime.now(TIMEZONE)
         timestamp = current_time.strftime('%Y-%m-%d %H:%M:%S')
         
-        # 提取IP与域名的映射
-        ips = {}
-        domains = CF_DOMAINS if isinstance(CF_DOMAINS, list) else CF_DOMAINS.split(',')
-        
-        # 获取当前IP配置
-        for i, domain in enumerate(domains):
-            if i < len(ip_list):
-                ips[domain.strip()] = ip_list[i]['ip']
-            else:
-                # 如果域名数量超过IP数量，复用最后一个IP
-                ips[domain.strip()] = ip_list[-1]['ip'] if ip_list else ""
+        # 提取IP与域名的映射，与写入hosts的内容一致
+        if not isinstance(ip_table, dict):
+            ip_table = {domain: ip_table for domain in normalize_domains(load_config()['CF_DOMAINS'])}
+        ips = {domain: ', '.join(r.ip for r in ip_list) for domain, ip_list in ip_table.items()}
         
         # 构建更新记录
         update_record = {
@@ -634,103 +1390,112 @@ def save_update_history(ip_list, is_scheduled):
         if len(history) > 50:
             history = history[-50:]
         
-        # 保存更新的历史
-        with open(UPDATE_HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
+        # 原子保存更新的历史
+        atomic_write(UPDATE_HISTORY_FILE, json.dumps(history, ensure_ascii=False, indent=2))
         
+        event_bus.publish('history', update_record)
         logger.info(f"更新历史已记录到 {UPDATE_HISTORY_FILE}")
         return True
     except Exception as e:
         logger.error(f"记录更新历史失败: {str(e)}")
         return False
 
-def update_all_hosts(is_scheduled=False):
-    """更新所有目标容器的hosts文件"""
+def update_all_hosts(is_scheduled=False, on_output=None):
+    """更新所有目标容器的hosts文件，返回是否成功
+    
+    Args:
+        is_scheduled: 是否由定时任务触发
+        on_output: 可选回调，接收测速输出和流程进度
+    """
     # 添加日志记录触发方式
     if is_scheduled:
         logger.info("定时任务触发")
     else:
         logger.info("非定时任务触发")
         
-    # 重新加载配置以确保使用最新配置（添加日志和时间检查以避免频繁加载）
-    global TARGET_CONTAINERS, CF_DOMAINS, IP_COUNT, PREFERRED_IP, SPEED_TEST_ARGS
+    # 整个流程使用同一份配置快照（配置文件变化时才会重新解析）
+    config = load_config()
     
-    # 获取当前时间作为时间戳
-    current_time = time.time()
-    
-    # 如果配置文件存在，并且自上次加载后可能已被修改，才重新加载
-    reload_config = False
-    if os.path.exists(CONFIG_TOML):
+    # 定时任务优先快速复测历史优选IP，劣化时才运行完整测速
+    ip_list = None
+    if is_scheduled and FAST_REVALIDATE and not config['PREFERRED_IP']:
         try:
-            # 获取配置文件的最后修改时间
-            config_mtime = os.path.getmtime(CONFIG_TOML)
-            
-            # 如果配置文件的修改时间比上次加载时间晚，则重新加载
-            if not hasattr(update_all_hosts, 'last_config_load') or config_mtime > update_all_hosts.last_config_load:
-                reload_config = True
-                logger.info("检测到配置文件已更新，重新加载配置")
+            ip_list = revalidate_known_ips(config)
         except Exception as e:
-            logger.warning(f"检查配置文件修改时间出错: {str(e)}，将重新加载配置")
-            reload_config = True
-    
-    if reload_config:
-        config = load_config()
-        TARGET_CONTAINERS = config['TARGET_CONTAINERS']
-        CF_DOMAINS = config['CF_DOMAINS']
-        IP_COUNT = config['IP_COUNT']
-        PREFERRED_IP = config['PREFERRED_IP']
-        SPEED_TEST_ARGS = config['SPEED_TEST_ARGS']
-        
-        # 更新最后加载时间
-        update_all_hosts.last_config_load = current_time
-    
-    # 执行测速
-    logger.info("开始执行IP优选流程")
-    successful = run_cloudflare_speedtest()
-    if not successful:
-        logger.error("测速失败，跳过更新hosts")
-        return
+            logger.error(f"快速复测出错: {str(e)}，改为运行完整测速")
     
-    # 解析结果
-    logger.info("解析测速结果")
-    ip_list = parse_speedtest_results()
+    if not ip_list:
+        # 执行测速
+        logger.info("开始执行IP优选流程")
+        successful = run_speedtest(on_output=on_output, config=config)
+        if not successful:
+            logger.error("测速失败，跳过更新hosts")
+            return False
+        
+        # 记录本次测速的全部结果，供按历史选择IP
+        if not config['PREFERRED_IP']:
+            record_speedtest_results(source='builtin' if SPEED_TEST_ENGINE == 'builtin' else 'cloudflarest')
+        
+        # 解析结果
+        logger.info("解析测速结果")
+        ip_list = select_ips(candidate_ip_count(config), config=config)
     if not ip_list:
         logger.error("没有获取到有效IP，跳过更新hosts")
-        return
+        return False
     
-    logger.info(f"获取到 {len(ip_list)} 个优选IP")
+    logger.info(f"获取到 {len(ip_list)} 个候选IP")
+    
+    # 按快照中的CF_DOMAINS生成每个域名的IP对照表
+    ip_table = build_ip_table(ip_list, config=config)
     
-    # 显式传递最新的CF_DOMAINS到generate_hosts_content函数
     logger.info("开始生成hosts文件内容")
-    hosts_content = generate_hosts_content(ip_list, domains=CF_DOMAINS)
+    hosts_content = generate_hosts_content(ip_table)
     if not hosts_content:
         logger.error("生成hosts内容失败，跳过更新")
-        return
+        return False
     
     # 保存hosts文件
     logger.info("保存hosts文件")
     save_result = save_hosts_file(hosts_content)
     if not save_result:
         logger.error("保存hosts文件失败")
-        return
+        return False
+    record_selected_ips(ip_table)
     
-    # 更新容器hosts
-    if TARGET_CONTAINERS:
-        logger.info(f"开始更新 {len(TARGET_CONTAINERS)} 个容器的hosts文件")
-        success_count = 0
-        for container in TARGET_CONTAINERS:
-            if container:
-                if update_container_hosts(container, hosts_content):
-                    success_count += 1
-        
-        logger.info(f"容器hosts更新完成: {success_count}/{len(TARGET_CONTAINERS)} 个成功")
-    else:
-        logger.info("未配置目标容器，跳过容器hosts更新")
+    # 并发更新容器hosts
+    report = update_containers_hosts(config['TARGET_CONTAINERS'], hosts_content)
+    if on_output:
+        on_output(f"容器hosts更新完成: {report['success']}/{report['total']} 个成功")
     
     # 记录更新历史
-    save_update_history(ip_list, is_scheduled)
+    save_update_history(ip_table, is_scheduled)
     
-    logger.info("IP优选和hosts更新流程完成")
+    logger.info("IP优选和hosts更新流程完成", extra={'event': 'update_finished'})
+    return True
+
+def update_all_hosts_job(job, is_scheduled=False):
+    """在任务执行器中运行完整的IP优选和hosts更新流程"""
+    started = time.time()
+    success = update_all_hosts(is_scheduled=is_scheduled, on_output=job.append)
+    record_update('scheduled' if is_scheduled else 'manual', success)
+    if success:
+        if not is_scheduled:
+            # 手动测速成功后，下一次定时任务从这次测速开始计时（定时任务由调度器自己计时）
+            scheduler.notify_run(started)
+        return True, 'IP优选完成，并已更新hosts'
+    return False, 'IP优选失败'
+
+def run_scheduled_update():
+    """定时任务入口：通过任务执行器运行，与手动触发的测速互斥"""
+    job, created = job_runner.submit('speedtest', '定时IP优选', update_all_hosts_job, is_scheduled=True)
+    if not created:
+        logger.info(f"已有测速任务 {job.id} 在运行或排队，定时任务已合并")
+    job.wait()
+
+# 调度器：休眠到下一次执行时间，配置变化或手动测速时被唤醒重新计算
+scheduler = Scheduler(current_schedule, run_scheduled_update,
+                      jitter=parse_time_interval(UPDATE_JITTER) if UPDATE_JITTER else 0,
+                      on_schedule=log_next_run, logger=logger)
 
 def main():
     """主函数"""
@@ -742,44 +1507,55 @@ def main():
     else:
         logger.info("检测到非初次启动，使用现有配置文件")
     
-    # 启动后的第一次更新
-    logger.info("执行启动后的首次hosts更新")
-    update_all_hosts(is_scheduled=False)
+    if len(docker_clients) > 1:
+        logger.info(f"Docker节点: {', '.join(f'{name}({client.base_url})' for name, client in docker_clients.items())}")
     
-    # 解析更新间隔并设置定时任务
-    interval_seconds = parse_time_interval(UPDATE_INTERVAL)
-    logger.info(f"设置定时任务，间隔: {interval_seconds}秒")
+    # 先开始监听容器事件，首次更新期间启动的容器也能及时写入
+    if WATCH_DOCKER_EVENTS:
+        for watcher in container_watchers:
+            watcher.start()
+        logger.info(f"已开始监听 {len(container_watchers)} 个Docker节点上目标容器的启动事件")
     
-    # 记录下一次定时任务的执行时间（使用上海时区）
-    next_run = time.time() + interval_seconds
-    next_run_time = datetime.fromtimestamp(next_run, TIMEZONE)
-    logger.info(f"下一次定时任务将在 {next_run_time.strftime('%Y-%m-%d %H:%M:%S')} 执行")
-    
-    # 使用schedule库设置定时任务，传递is_scheduled=True参数
-    schedule.every(interval_seconds).seconds.do(update_all_hosts, is_scheduled=True)
+    # 启动后的第一次更新
+    logger.info("执行启动后的首次hosts更新")
+    started = time.time()
+    job_runner.run('speedtest', '启动IP优选', update_all_hosts_job, is_scheduled=False)
     
-    # 主循环
+    # 调度循环：下一次定时任务从启动更新开始计时，通过任务执行器以is_scheduled=True运行
+    scheduler.notify_run(started)
     try:
-        while True:
-            schedule.run_pending()
-            time.sleep(60)  # 每分钟检查一次
+        scheduler.run_forever()
     except KeyboardInterrupt:
         logger.info("程序被用户中断")
     except Exception as e:
         logger.error(f"程序异常: {str(e)}")
     finally:
+        for watcher in container_watchers:
+            watcher.stop()
         logger.info("CloudflareIP-Hosts更新器已停止")
 
+def handle_sigterm(signum, frame):
+    """docker stop发送SIGTERM，按用户中断处理以便正常退出"""
+    raise KeyboardInterrupt
+
 if __name__ == "__main__":
     # 启动Web服务（在新线程中运行）
-    import threading
-    from web import start_web_server
+    import signal
+    from web import WebServer
+    
+    signal.signal(signal.SIGTERM, handle_sigterm)
     
     # 创建并启动Web服务器线程
-    web_thread = threading.Thread(target=start_web_server)
+    web_server = WebServer()
+    web_thread = threading.Thread(target=web_server.serve_forever, name='web')
     web_thread.daemon = True  # 设置为守护线程，主程序退出时自动退出
     web_thread.start()
     logger.info("Web服务已启动")
     
-    # 启动主程序
-    main() 
\ No newline at end of file
+    # 启动主程序，退出时等待进行中的Web请求完成
+    try:
+        main()
+    except KeyboardInterrupt:
+        logger.info("程序被用户中断")
+    finally:
+        web_server.shutdown()
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+运行指标
+计数器、仪表和直方图，按Prometheus文本格式（0.0.4）输出，供/metrics接口抓取；
+只在内存中累加，记录一次只需一次加锁，不依赖第三方库
+"""
+
+import math
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+
+# 默认直方图桶（秒），覆盖毫秒级的Docker调用到分钟级的测速
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, int) or (isinstance(value, float) and value.is_integer() and abs(value) < 1e15):
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """带标签的指标，每组标签值对应一个序列"""
+
+    kind = ''
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        """删除所有序列（例如标签值整体更换时）"""
+        with self._lock:
+            self._series.clear()
+
+    def samples(self):
+        """返回[(指标名后缀, 标签值, 额外标签, 数值)]"""
+        raise NotImplementedError
+
+    @property
+    def family(self):
+        """HELP/TYPE行使用的名称，0.0.4格式要求与序列名一致"""
+        return self.name
+
+    def render(self):
+        lines = [f"# HELP {self.family} {self.documentation}", f"# TYPE {self.family} {self.kind}"]
+        for suffix, values, extra, value in self.samples():
+            labels = _format_labels(self.labelnames, values, extra)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    kind = 'counter'
+
+    @property
+    def family(self):
+        return f"{self.name}_total"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            # 序列名带_total后缀
+            return [('_total', key, (), value) for key, value in sorted(self._series.items())]
+
+
+class Gauge(_Metric):
+    """可任意设置的仪表；function不为None时在输出时调用它取值（仅限无标签的仪表）"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def samples(self):
+        if self.function is not None:
+            value = self.function()
+            return [] if value is None else [('', (), (), value)]
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._series.items())]
+
+
+class Histogram(_Metric):
+    """累积直方图，记录观测值的分布、总和与次数"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # 每个桶只记录落在该桶内的次数，输出时再累加
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """统计with块的耗时（秒），块内抛出异常时同样记录"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            series = [(key, list(s['counts']), s['sum'], s['count']) for key, s in sorted(self._series.items())]
+        samples = []
+        for key, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                samples.append(('_bucket', key, (('le', _format_value(float(bound))),), cumulative))
+            samples.append(('_sum', key, (), total))
+            samples.append(('_count', key, (), count))
+        return samples
+
+
+class Registry:
+    """指标注册表，按注册顺序输出"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self.register(Gauge(name, documentation, labelnames, function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Prometheus文本格式"""
+        return '\n'.join(metric.render() for metric in self._metrics) + '\n'
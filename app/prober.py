@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+内置延迟探测
+使用asyncio并发对一组IP发起TCP连接（或TLS握手），测量连接延迟和丢包率；
+也可作为CloudflareST之外的测速引擎，从CIDR列表抽样IP并写出相同格式的结果文件
+"""
+
+import os
+import csv
+import ssl
+import time
+import random
+import asyncio
+import ipaddress
+
+from records import SpeedTestRecord
+
+# 与CloudflareST结果文件一致的表头
+RESULT_HEADER = ['IP 地址', '已发送', '已接收', '丢包率', '平均延迟', '下载速度 (MB/s)', '地区码']
+
+
+async def tcp_connect_latency(ip, port=443, timeout=1.0):
+    """测量一次TCP连接耗时（毫秒），失败或超时返回None"""
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    latency = (time.perf_counter() - start) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return latency
+
+
+def make_ssl_context(verify=False):
+    """创建TLS探测使用的SSL上下文，默认只测握手耗时而不校验证书"""
+    context = ssl.create_default_context()
+    if not verify:
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+async def tls_handshake_latency(ip, port=443, server_name=None, timeout=2.0, ssl_context=None):
+    """测量一次TCP连接+TLS握手的总耗时（毫秒），失败或超时返回None"""
+    ssl_context = ssl_context or make_ssl_context()
+    start = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(
+            asyncio.open_connection(ip, port, ssl=ssl_context, server_hostname=server_name or ip),
+            timeout)
+    except (OSError, ssl.SSLError, asyncio.TimeoutError):
+        return None
+    latency = (time.perf_counter() - start) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except (OSError, ssl.SSLError):
+        pass
+    return latency
+
+
+async def probe_ip(ip, port=443, attempts=4, timeout=1.0, mode='tcp', server_name=None, ssl_context=None):
+    """对单个IP探测attempts次，返回SpeedTestRecord（全部失败时延迟为0、丢包率为1）
+
+    mode为'tcp'时测量TCP连接耗时，为'tls'时测量TCP连接+TLS握手耗时。
+    """
+    latencies = []
+    for _ in range(attempts):
+        if mode == 'tls':
+            latency = await tls_handshake_latency(ip, port, server_name, timeout, ssl_context)
+        else:
+            latency = await tcp_connect_latency(ip, port, timeout)
+        if latency is not None:
+            latencies.append(latency)
+    received = len(latencies)
+    return SpeedTestRecord(
+        ip=ip,
+        sent=attempts,
+        received=received,
+        loss_rate=round(1 - received / attempts, 2) if attempts else 1.0,
+        latency=round(sum(latencies) / received, 2) if received else 0.0,
+    )
+
+
+async def probe_ips_async(ips, port=443, attempts=4, timeout=1.0, concurrency=200,
+                          mode='tcp', server_name=None, on_progress=None):
+    """并发探测多个IP，并发数由信号量限制，结果按IP输入顺序返回
+
+    on_progress(已完成数, 总数)在每个IP探测结束后调用。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    ssl_context = make_ssl_context() if mode == 'tls' else None
+    total = len(ips)
+    finished = 0
+
+    async def bounded(ip):
+        nonlocal finished
+        async with semaphore:
+            record = await probe_ip(ip, port, attempts, timeout, mode, server_name, ssl_context)
+        finished += 1
+        if on_progress:
+            on_progress(finished, total)
+        return record
+
+    return await asyncio.gather(*(bounded(ip) for ip in ips))
+
+
+def probe_ips(ips, port=443, attempts=4, timeout=1.0, concurrency=200, mode='tcp', server_name=None,
+              on_progress=None):
+    """probe_ips_async的同步入口（在没有事件循环的线程中调用）"""
+    ips = list(ips)
+    if not ips:
+        return []
+    return asyncio.run(probe_ips_async(ips, port, attempts, timeout, concurrency, mode, server_name,
+                                       on_progress))
+
+
+async def probe_server_names_async(ips, server_names, port=443, attempts=2, timeout=2.0, concurrency=200,
+                                   verify=True):
+    """以每个域名作为SNI对同一组IP做TLS握手探测，所有探测共享一个并发上限
+
+    verify为True时校验证书，握手失败（IP不承载该域名）计为丢包。
+    返回 {域名: [SpeedTestRecord, ...]}。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    ssl_context = make_ssl_context(verify=verify)
+
+    async def bounded(ip, server_name):
+        async with semaphore:
+            return await probe_ip(ip, port, attempts, timeout, 'tls', server_name, ssl_context)
+
+    targets = [(ip, name) for name in server_names for ip in ips]
+    records = await asyncio.gather(*(bounded(ip, name) for ip, name in targets))
+    results = {name: [] for name in server_names}
+    for (_, name), record in zip(targets, records):
+        results[name].append(record)
+    return results
+
+
+def probe_server_names(ips, server_names, port=443, attempts=2, timeout=2.0, concurrency=200, verify=True):
+    """probe_server_names_async的同步入口"""
+    ips, server_names = list(ips), list(server_names)
+    if not ips or not server_names:
+        return {name: [] for name in server_names}
+    return asyncio.run(probe_server_names_async(ips, server_names, port, attempts, timeout, concurrency, verify))
+
+
+def rank_records(records, max_loss=1.0):
+    """过滤掉丢包率超过max_loss的记录，按丢包率、延迟排序"""
+    alive = [r for r in records if r.received and r.loss_rate <= max_loss]
+    return sorted(alive, key=lambda r: (r.loss_rate, r.latency))
+
+
+def load_cidrs(path):
+    """读取CIDR列表文件（每行一个网段，支持#注释），返回ip_network列表"""
+    networks = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.split('#', 1)[0].strip()
+            if line:
+                networks.append(ipaddress.ip_network(line, strict=False))
+    return networks
+
+
+def sample_ips(networks, per_block=1, max_ips=None, rng=None):
+    """从网段中抽样IP
+
+    IPv4网段按/24划分，每个/24随机取per_block个地址（与CloudflareST的默认方式一致）；
+    IPv6网段整体随机取per_block个地址。总数超过max_ips时再随机抽取。
+    """
+    rng = rng or random.Random()
+    ips = []
+    for network in networks:
+        if network.version == 4 and network.prefixlen < 24:
+            blocks = network.subnets(new_prefix=24)
+        else:
+            blocks = [network]
+        for block in blocks:
+            count = min(per_block, block.num_addresses)
+            offsets = rng.sample(range(block.num_addresses), count) if block.num_addresses < 2 ** 32 \
+                else [rng.randrange(block.num_addresses) for _ in range(count)]
+            ips.extend(str(block.network_address + offset) for offset in offsets)
+    if max_ips and len(ips) > max_ips:
+        ips = rng.sample(ips, max_ips)
+    return ips
+
+
+def write_results_csv(path, records):
+    """以CloudflareST的格式写出结果文件（先写临时文件再替换，避免读到半个文件）"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(RESULT_HEADER)
+        for r in records:
+            writer.writerow([r.ip, r.sent, r.received, f"{r.loss_rate:.2f}", f"{r.latency:.2f}",
+                             f"{r.download_speed:.2f}", r.colo])
+    os.replace(tmp_path, path)
+
+
+def run_builtin_speedtest(cidr_file, output, port=443, per_block=1, max_ips=5000, attempts=4,
+                          timeout=1.0, concurrency=1000, mode='tcp', server_name=None,
+                          max_loss=0.25, on_progress=None):
+    """内置测速引擎：抽样、并发探测、排序并写出结果文件，返回排序后的记录"""
+    ips = sample_ips(load_cidrs(cidr_file), per_block=per_block, max_ips=max_ips)
+    records = probe_ips(ips, port=port, attempts=attempts, timeout=timeout, concurrency=concurrency,
+                        mode=mode, server_name=server_name, on_progress=on_progress)
+    ranked = rank_records(records, max_loss=max_loss)
+    write_results_csv(output, ranked)
+    return ranked
@@ -0,0 +1,26 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+测速结果记录
+CloudflareST结果解析、内置探测和IP质量数据库共用的数据结构
+"""
+
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class SpeedTestRecord:
+    """单个IP的测速结果"""
+    ip: str
+    sent: int = 0
+    received: int = 0
+    loss_rate: float = 0.0
+    latency: float = 0.0
+    download_speed: float = 0.0
+    colo: str = ''
+
+    @property
+    def speed(self):
+        """兼容旧模板中的{speed}字段（平均延迟，毫秒）"""
+        return self.latency
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+定时调度
+调度线程一直休眠到下一次执行时间，配置变化或手动触发时立即被唤醒并重新计算；
+执行时间支持固定间隔（可加随机抖动）和cron表达式（分 时 日 月 周）
+"""
+
+import time
+import random
+import threading
+from datetime import datetime, timedelta
+
+# cron各字段的取值范围：分、时、日、月、周（0和7都表示周日）
+CRON_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+# 单次休眠的上限，系统时间被调整后最迟在这么久之后按新的时间重新计算剩余时长
+MAX_SLEEP = 3600
+
+# 执行计划无法计算下一次执行时间时使用的间隔（秒）
+FALLBACK_INTERVAL = 12 * 3600
+
+
+def parse_cron_field(text, low, high):
+    """解析cron的一个字段，支持 *、a、a-b、*/n、a-b/n、a/n 以及逗号分隔的组合"""
+    values = set()
+    for part in text.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"无效的步长: {text}")
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(v) for v in part.split('-', 1))
+        else:
+            start = int(part)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high:
+            raise ValueError(f"取值超出范围 {low}-{high}: {text}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class IntervalSchedule:
+    """固定间隔"""
+
+    def __init__(self, seconds):
+        self.seconds = max(1, int(seconds))
+
+    def next_run(self, last_run, now):
+        """从上一次执行起算；错过的执行（如上一次执行耗时超过间隔）立即补一次，而不是连续补多次"""
+        return max(last_run + self.seconds, now)
+
+    def __str__(self):
+        return f"每{self.seconds}秒"
+
+
+class CronSchedule:
+    """cron表达式（分 时 日 月 周），按给定时区计算"""
+
+    def __init__(self, expression, tz):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron表达式需要5个字段: {expression}")
+        self.expression = expression
+        self.tz = tz
+        minutes, hours, days, months, weekdays = (
+            parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_RANGES))
+        self.minutes, self.hours, self.days, self.months = minutes, hours, days, months
+        self.weekdays = {d % 7 for d in weekdays}
+        # 与cron一致：日和周都被限定时，满足其一即可
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def _day_matches(self, dt):
+        day_ok = dt.day in self.days
+        weekday_ok = dt.isoweekday() % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day_ok and weekday_ok
+        return day_ok or weekday_ok
+
+    def next_run(self, last_run, now):
+        """按墙上时间计算，与上一次执行时间无关"""
+        return self.next_after(now)
+
+    def next_after(self, ts):
+        """ts之后（不含ts所在的分钟）第一个匹配的时间"""
+        dt = datetime.fromtimestamp(ts, self.tz).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = dt + timedelta(days=366 * 5)
+        while dt < limit:
+            if dt.month not in self.months:
+                dt = (dt.replace(day=1) + timedelta(days=32)).replace(day=1, hour=0, minute=0)
+            elif not self._day_matches(dt):
+                dt = (dt + timedelta(days=1)).replace(hour=0, minute=0)
+            elif dt.hour not in self.hours:
+                dt = (dt + timedelta(hours=1)).replace(minute=0)
+            elif dt.minute not in self.minutes:
+                dt += timedelta(minutes=1)
+            else:
+                return dt.timestamp()
+        raise ValueError(f"cron表达式没有可执行的时间: {self.expression}")
+
+    def __str__(self):
+        return f"cron({self.expression})"
+
+
+class Scheduler:
+    """单任务调度器
+
+    get_schedule()返回当前的执行计划（IntervalSchedule或CronSchedule），每次重新计算时调用，
+    因此配置变化后调用reschedule()即可生效。run()在调度线程中执行并阻塞到本次执行结束，
+    同一时间只会有一次执行。on_schedule(下一次执行时间戳)在每次计算出新的执行时间后调用。
+    执行计划出错时按FALLBACK_INTERVAL计算，调度线程不会因此退出。
+    """
+
+    def __init__(self, get_schedule, run, jitter=0, on_schedule=None, logger=None):
+        self.get_schedule = get_schedule
+        self.run = run
+        self.jitter = jitter
+        self.on_schedule = on_schedule
+        self.logger = logger
+        self._cond = threading.Condition()
+        self._anchor = time.time()  # 上一次执行的开始时间，固定间隔从这里起算
+        self._next_run = None
+        self._dirty = True
+        self._running = False
+        self._stopped = False
+
+    @property
+    def next_run(self):
+        return self._next_run
+
+    @property
+    def running(self):
+        return self._running
+
+    def reschedule(self):
+        """执行计划变化（如修改了更新间隔），立即重新计算下一次执行时间"""
+        with self._cond:
+            self._dirty = True
+            self._cond.notify_all()
+
+    def notify_run(self, ts=None):
+        """在调度器之外执行过一次（如手动触发），下一次执行从该时间起算"""
+        with self._cond:
+            self._anchor = ts or time.time()
+            self._dirty = True
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _compute_next(self):
+        now = time.time()
+        try:
+            next_run = self.get_schedule().next_run(self._anchor, now)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"计算下一次执行时间失败: {str(e)}，使用默认间隔{FALLBACK_INTERVAL}秒")
+            next_run = IntervalSchedule(FALLBACK_INTERVAL).next_run(self._anchor, now)
+        if self.jitter:
+            next_run += random.uniform(0, self.jitter)
+        return next_run
+
+    def _wait_for_due(self):
+        """休眠到下一次执行时间，返回False表示调度器已停止（调用方需持有锁）"""
+        while not self._stopped:
+            if self._dirty:
+                self._next_run = self._compute_next()
+                self._dirty = False
+                if self.on_schedule:
+                    self.on_schedule(self._next_run)
+            remaining = self._next_run - time.time()
+            if remaining <= 0:
+                return True
+            self._cond.wait(min(remaining, MAX_SLEEP))
+        return False
+
+    def run_forever(self):
+        """在当前线程中运行调度循环，直到stop()"""
+        while True:
+            with self._cond:
+                if not self._wait_for_due():
+                    return
+                self._running = True
+                self._next_run = None
+            started = time.time()
+            try:
+                self.run()
+            finally:
+                with self._cond:
+                    self._running = False
+                    self._anchor = started
+                    self._dirty = True
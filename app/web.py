@@ -9,14 +9,17 @@ CloudflareIP-Hosts更新器Web界面
 import os
 import time
 import json
-import subprocess
+import socket
+import threading
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, jsonify
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify
+from docker_api import DockerAPIError
 
 # 导入主程序中的配置和函数
 from main import (
     logger, 
-    CONFIG,
+    log_buffer,
     TIMEZONE,
     VERSION,
     load_config,
@@ -24,21 +27,49 @@ from main import (
     HOSTS_FILE,
     UPDATE_HISTORY_FILE,
     SPEEDTEST_RESULT,
-    update_all_hosts,
-    run_cloudflare_speedtest,
-    parse_speedtest_results,
+    update_all_hosts_job,
+    job_runner,
+    scheduler,
+    select_ips,
+    candidate_ip_count,
+    build_ip_table,
+    ip_db,
+    parse_time_interval,
     generate_hosts_content,
     save_hosts_file,
-    update_container_hosts,
+    update_containers_hosts,
+    read_container_hosts,
+    docker_clients,
+    container_label,
+    resolve_target_containers,
+    PUSH_WORKERS,
     HOSTS_MARKER,
-    CF_DOMAINS,
-    save_update_history
+    save_update_history,
+    parse_hosts_ips,
+    event_bus,
+    metrics,
+    record_update,
+    record_selected_ips
 )
 
 app = Flask(__name__)
 
 # 配置
 WEB_PORT = int(os.environ.get('WEB_PORT', '8080'))
+# WSGI服务器：工作线程数、最大连接数、空闲keep-alive连接超时秒数、停止时等待进行中请求的秒数
+WEB_THREADS = int(os.environ.get('WEB_THREADS', '16'))
+WEB_CONNECTION_LIMIT = int(os.environ.get('WEB_CONNECTION_LIMIT', '100'))
+WEB_CHANNEL_TIMEOUT = int(os.environ.get('WEB_CHANNEL_TIMEOUT', '120'))
+WEB_SHUTDOWN_TIMEOUT = int(os.environ.get('WEB_SHUTDOWN_TIMEOUT', '10'))
+# 事件流长连接会一直占用一个工作线程，限制其数量，保证普通请求总有空闲线程
+WEB_STREAM_LIMIT = int(os.environ.get('WEB_STREAM_LIMIT', str(max(1, WEB_THREADS // 2))))
+# 容器状态：单个容器的读取超时秒数，结果缓存秒数
+CONTAINER_STATUS_TIMEOUT = int(os.environ.get('CONTAINER_STATUS_TIMEOUT', '5'))
+CONTAINER_STATUS_TTL = int(os.environ.get('CONTAINER_STATUS_TTL', '10'))
+
+# 服务停止时置位，正在推送的事件流随之结束
+web_stopping = threading.Event()
+stream_slots = threading.BoundedSemaphore(WEB_STREAM_LIMIT)
 
 # 读取环境变量并返回字典
 def get_config():
@@ -48,8 +79,8 @@ def get_config():
     # 将列表类型转换为逗号分隔的字符串，方便前端显示
     result = {
         'UPDATE_INTERVAL': config['UPDATE_INTERVAL'],
-        'TARGET_CONTAINERS': ','.join(config['TARGET_CONTAINERS']) if isinstance(config['TARGET_CONTAINERS'], list) else config['TARGET_CONTAINERS'],
-        'CF_DOMAINS': ','.join(config['CF_DOMAINS']) if isinstance(config['CF_DOMAINS'], list) else config['CF_DOMAINS'],
+        'TARGET_CONTAINERS': ','.join(config['TARGET_CONTAINERS']),
+        'CF_DOMAINS': ','.join(config['CF_DOMAINS']),
         'IP_COUNT': config['IP_COUNT'],
         'PREFERRED_IP': config['PREFERRED_IP'],
         'SPEED_TEST_ARGS': config['SPEED_TEST_ARGS']
@@ -59,14 +90,15 @@ def get_config():
 
 # 保存配置（通过调用main.py中的save_config函数）
 def update_configuration(config_data):
-    # 准备配置数据
+    # 准备配置数据（未提交的项沿用当前配置）
+    current = get_config()
     config = {
-        'UPDATE_INTERVAL': config_data.get('UPDATE_INTERVAL', CONFIG['UPDATE_INTERVAL']),
-        'TARGET_CONTAINERS': config_data.get('TARGET_CONTAINERS', ','.join(CONFIG['TARGET_CONTAINERS']) if isinstance(CONFIG['TARGET_CONTAINERS'], list) else CONFIG['TARGET_CONTAINERS']),
-        'CF_DOMAINS': config_data.get('CF_DOMAINS', ','.join(CONFIG['CF_DOMAINS']) if isinstance(CONFIG['CF_DOMAINS'], list) else CONFIG['CF_DOMAINS']),
-        'IP_COUNT': int(config_data.get('IP_COUNT', CONFIG['IP_COUNT'])),
-        'PREFERRED_IP': config_data.get('PREFERRED_IP', CONFIG['PREFERRED_IP']),
-        'SPEED_TEST_ARGS': config_data.get('SPEED_TEST_ARGS', CONFIG['SPEED_TEST_ARGS'])
+        'UPDATE_INTERVAL': config_data.get('UPDATE_INTERVAL', current['UPDATE_INTERVAL']),
+        'TARGET_CONTAINERS': config_data.get('TARGET_CONTAINERS', current['TARGET_CONTAINERS']),
+        'CF_DOMAINS': config_data.get('CF_DOMAINS', current['CF_DOMAINS']),
+        'IP_COUNT': int(config_data.get('IP_COUNT', current['IP_COUNT'])),
+        'PREFERRED_IP': config_data.get('PREFERRED_IP', current['PREFERRED_IP']),
+        'SPEED_TEST_ARGS': config_data.get('SPEED_TEST_ARGS', current['SPEED_TEST_ARGS'])
     }
     
     # 保存到config.toml
@@ -79,84 +111,80 @@ def update_configuration(config_data):
     
     return success
 
-# 获取日志
+# 获取最近的日志（从内存中的日志缓冲区读取，不访问日志文件）
 def get_logs(lines=50):
-    log_path = '/app/data/updater.log'
-    if os.path.exists(log_path):
-        try:
-            result = subprocess.run(['tail', '-n', str(lines), log_path], 
-                                   capture_output=True, text=True)
-            return result.stdout
-        except Exception as e:
-            return f"读取日志出错: {str(e)}"
-    return "日志文件不存在"
+    entries, _, _ = log_buffer.query(limit=lines)
+    return '\n'.join(entry['text'] for entry in entries)
 
 # 获取当前使用的IP
 def get_current_ips():
     try:
         if os.path.exists(HOSTS_FILE):
             with open(HOSTS_FILE, 'r') as f:
-                content = f.read()
-                # 改进hosts文件解析逻辑
-                ips = {}
-                for line in content.splitlines():
-                    # 跳过注释行或空行
-                    if not line or line.startswith('#'):
-                        continue
-                    
-                    # 必须包含IP地址（第一部分）和域名（第二部分）
-                    parts = line.split()
-                    if len(parts) >= 2:
-                        # 第一部分是IP地址
-                        ip = parts[0]
-                        # 第二部分是域名
-                        domain = parts[1]
-                        
-                        # 验证IP格式（简单检查）
-                        if all(part.isdigit() for part in ip.split('.')):
-                            ips[domain] = ip
-                return ips
+                return parse_hosts_ips(f.read())
         return {}
     except Exception as e:
         logger.error(f"获取当前IP出错: {str(e)}")
         return {}
 
-# 获取容器状态
+# 读取单个节点上单个容器的状态
+def _read_container_status(node, container, timeout):
+    status = {'name': container_label(container, node), 'node': node, 'exists': False}
+    try:
+        # 通过归档接口读取容器hosts文件，容器不存在时返回404
+        hosts_content, _ = read_container_hosts(container, timeout=timeout, node=node)
+        return dict(status, exists=True, hosts=hosts_content)
+    except DockerAPIError as e:
+        if e.status == 404:
+            return dict(status, hosts='')
+        return dict(status, error=str(e))
+    except socket.timeout:
+        return dict(status, error=f"读取超时（{timeout}秒）")
+    except Exception as e:
+        return dict(status, error=str(e))
+
+# 获取所有节点上的容器状态（并发读取，带超时）
 def get_container_status():
     # 获取最新配置中的容器列表
-    config = load_config()
-    target_containers = config['TARGET_CONTAINERS']
+    target_containers = load_config()['TARGET_CONTAINERS']
+    targets = [(node, container) for node in docker_clients
+               for container in resolve_target_containers(target_containers, node)]
+    if not targets:
+        return []
     
-    containers = []
-    for container in target_containers:
-        if not container:
-            continue
-        try:
-            # 检查容器是否存在
-            result = subprocess.run(['docker', 'inspect', container], 
-                                    capture_output=True, text=True)
-            exists = result.returncode == 0
-            
-            # 获取容器hosts文件内容
-            hosts_content = ""
-            if exists:
-                hosts_cmd = f"docker exec {container} cat /etc/hosts"
-                result = subprocess.run(hosts_cmd, shell=True, capture_output=True, text=True)
-                if result.returncode == 0:
-                    hosts_content = result.stdout
-            
-            containers.append({
-                'name': container,
-                'exists': exists,
-                'hosts': hosts_content
-            })
-        except Exception as e:
-            containers.append({
-                'name': container,
-                'exists': False,
-                'error': str(e)
-            })
-    return containers
+    statuses = {}
+    executor = ThreadPoolExecutor(max_workers=min(PUSH_WORKERS, len(targets)),
+                                  thread_name_prefix='container-status')
+    futures = {executor.submit(_read_container_status, node, container, CONTAINER_STATUS_TIMEOUT):
+               (node, container) for node, container in targets}
+    try:
+        for future in as_completed(futures, timeout=CONTAINER_STATUS_TIMEOUT + 1):
+            statuses[futures[future]] = future.result()
+    except FuturesTimeoutError:
+        pass
+    finally:
+        # 不等待卡住的读取，超时的容器单独标记
+        executor.shutdown(wait=False)
+    
+    return [statuses.get(target) or
+            {'name': container_label(target[1], target[0]), 'node': target[0], 'exists': False,
+             'error': f"读取超时（{CONTAINER_STATUS_TIMEOUT}秒）"}
+            for target in targets]
+
+# 带短时缓存的容器状态，缓存过期前的请求直接返回缓存，同时只有一个请求在刷新
+_container_status_lock = threading.Lock()
+_container_status_cache = {'key': None, 'updated_at': 0.0, 'containers': []}
+
+def get_cached_container_status(refresh=False):
+    # 容器列表变化或有新的推送结果时缓存立即失效
+    key = (tuple(load_config()['TARGET_CONTAINERS']), event_bus.latest('containers'))
+    with _container_status_lock:
+        cache = _container_status_cache
+        if refresh or cache['key'] != key or time.time() - cache['updated_at'] > CONTAINER_STATUS_TTL:
+            cache['containers'] = get_container_status()
+            cache['key'] = key
+            cache['updated_at'] = time.time()
+        return cache['containers'], cache['updated_at']
 
 # 获取更新历史
 def get_update_history():
@@ -174,11 +202,13 @@ def get_update_history():
 # 路由
 @app.route('/')
 def index():
+    # 先记录当前事件序号，页面据此订阅之后的实时事件
+    event_id = event_bus.last_id
     data = {
+        'event_id': event_id,
         'config': get_config(),
         'logs': get_logs(),
         'current_ips': get_current_ips(),
-        'containers': get_container_status(),
         'last_update': get_last_update_time(),
         'version': VERSION,
         'update_history': get_update_history()
@@ -213,100 +243,237 @@ def update_config():
     
     success = update_configuration(config)
     
-    # 配置更新后立即更新hosts文件
+    # 配置更新后立即在后台使用已有测速结果更新hosts文件
     if success:
-        try:
-            # 不运行测速，直接使用已有结果更新hosts
-            logger.info("配置已更新，使用现有测速结果更新hosts文件")
-            
-            # 获取最新的配置
-            config = load_config()
-            # 获取最新的域名配置
-            new_domains = config['CF_DOMAINS']
-            
-            # 直接解析结果文件，不运行测速
-            ip_list = parse_speedtest_results()
-            if ip_list:
-                # 使用最新配置中的域名生成hosts内容
-                hosts_content = generate_hosts_content(ip_list, domains=new_domains)
-                if hosts_content:
-                    save_hosts_file(hosts_content)
-                    # 更新容器
-                    for container in config['TARGET_CONTAINERS']:
-                        if container:
-                            update_container_hosts(container, hosts_content)
-            time.sleep(1)  # 添加短暂延迟，确保文件更新完成
-        except Exception as e:
-            logger.error(f"更新配置后更新hosts文件失败: {str(e)}")
+        logger.info("配置已更新，使用现有测速结果更新hosts文件")
+        # 正在运行的同类任务使用的是保存前的配置，只合并到排队中的任务
+        job_runner.submit('update_hosts', '沿用结果更新hosts', update_hosts_job, record_history=False,
+                          coalesce_running=False)
     
     return redirect(url_for('index'))
 
-# 手动触发测速
+# 沿用已有测速结果更新hosts（在任务执行器中运行）
+def update_hosts_job(job, record_history=True):
+    # 获取最新配置快照，整个流程使用同一份配置
+    config = load_config()
+    
+    # 直接使用已有结果（或历史测量），不运行测速
+    ip_list = select_ips(candidate_ip_count(config), config=config)
+    if not ip_list:
+        logger.error("无法从result.csv获取IP列表")
+        record_update('manual', False)
+        return False, "无法从result.csv获取IP列表"
+    
+    # 使用最新域名配置生成每个域名的IP对照表
+    ip_table = build_ip_table(ip_list, config=config)
+    hosts_content = generate_hosts_content(ip_table)
+    saved = bool(hosts_content) and save_hosts_file(hosts_content)
+    record_update('manual', saved)
+    if not saved:
+        # 与update_all_hosts一致：保存失败时不推送未保存的内容，也不记录历史
+        logger.error("保存hosts文件失败")
+        return False, '保存hosts文件失败'
+    record_selected_ips(ip_table)
+    
+    # 并发更新容器
+    report = update_containers_hosts(config['TARGET_CONTAINERS'], hosts_content)
+    job.append(f"容器hosts更新完成: {report['success']}/{report['total']} 个成功")
+    # 记录更新历史
+    if record_history:
+        save_update_history(ip_table, False)  # False表示非定时任务
+    return True, 'hosts文件已更新'
+
+# 提交任务并立即返回任务信息
+def submit_job(kind, name, target, **kwargs):
+    job, created = job_runner.submit(kind, name, target, **kwargs)
+    message = f"{name}已开始" if created else f"{job.name}正在进行中，已合并到该任务"
+    return jsonify({'success': True, 'running': True, 'job_id': job.id, 'coalesced': not created,
+                    'message': message})
+
+# 手动触发测速（后台运行，立即返回任务ID）
 @app.route('/run_speedtest', methods=['POST'])
 def trigger_speedtest():
     try:
-        # 获取最新配置
-        config = load_config()
-        domains = config['CF_DOMAINS']
-        
-        # 保留原有功能 - 运行测速并更新hosts
-        success = run_cloudflare_speedtest()
-        if success:
-            ip_list = parse_speedtest_results()
-            if ip_list:
-                # 使用最新域名配置
-                hosts_content = generate_hosts_content(ip_list, domains=domains)
-                if hosts_content:
-                    save_hosts_file(hosts_content)
-                    # 更新容器
-                    for container in config['TARGET_CONTAINERS']:
-                        if container:
-                            update_container_hosts(container, hosts_content)
-                    # 记录更新历史
-                    save_update_history(ip_list, False)  # False表示非定时任务
-            return jsonify({'success': True, 'message': 'IP优选完成，并已更新hosts'})
-        else:
-            return jsonify({'success': False, 'message': 'IP优选失败'})
+        return submit_job('speedtest', 'IP优选', update_all_hosts_job, is_scheduled=False)
     except Exception as e:
         return jsonify({'success': False, 'message': f'IP优选出错: {str(e)}'})
 
+# 沿用结果更新hosts（后台运行，立即返回任务ID）
 @app.route('/update_hosts', methods=['POST'])
 def update_hosts_only():
     try:
-        # 获取最新配置
-        config = load_config()
-        domains = config['CF_DOMAINS']
-        
-        # 直接解析结果文件，不运行测速
-        ip_list = parse_speedtest_results()
-        if ip_list:
-            # 使用最新域名配置
-            hosts_content = generate_hosts_content(ip_list, domains=domains)
-            if hosts_content:
-                save_hosts_file(hosts_content)
-                # 更新容器
-                for container in config['TARGET_CONTAINERS']:
-                    if container:
-                        update_container_hosts(container, hosts_content)
-                # 记录更新历史
-                save_update_history(ip_list, False)  # False表示非定时任务
-            return jsonify({'success': True, 'message': 'hosts文件已更新'})
-        else:
-            logger.error("无法从result.csv获取IP列表")
-            return jsonify({'success': False, 'message': "无法从result.csv获取IP列表"})
+        return submit_job('update_hosts', '沿用结果更新hosts', update_hosts_job)
     except Exception as e:
         logger.error(f"更新hosts出错: {str(e)}")
         return jsonify({'success': False, 'message': f"更新hosts出错: {str(e)}"})
 
-# 获取最新日志
+# 任务列表
+@app.route('/api/jobs')
+def api_jobs():
+    return jsonify({'jobs': [job.to_dict() for job in job_runner.list()], 'next_run': scheduler.next_run})
+
+# 查询任务状态
+@app.route('/api/jobs/<job_id>')
+def api_job(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': '任务不存在'}), 404
+    return jsonify(job.to_dict())
+
+# IP质量统计：最近一段时间综合表现最好和最稳定的IP
+@app.route('/api/ip_stats')
+def api_ip_stats():
+    window = request.args.get('window', '24h')
+    limit = request.args.get('limit', 20, type=int)
+    try:
+        since = parse_time_interval(window)
+        return jsonify({
+            'window': window,
+            'best': ip_db.best_ips(since_seconds=since, limit=limit),
+            'stable': ip_db.stable_ips(since_seconds=since, limit=limit),
+            'last_run': ip_db.last_run(),
+        })
+    except Exception as e:
+        logger.error(f"查询IP质量统计失败: {str(e)}")
+        return jsonify({'success': False, 'message': f"查询IP质量统计失败: {str(e)}"}), 500
+
+# 格式化一条SSE消息
+def sse_message(data, event=None, event_id=None):
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    if event:
+        lines.append(f"event: {event}")
+    lines.extend(f"data: {line}" for line in str(data).splitlines() or [''])
+    return '\n'.join(lines) + '\n\n'
+
+# 以SSE响应推送生成器的输出；占用一个事件流名额，名额用尽时返回503
+def sse_response(generate):
+    if not stream_slots.acquire(blocking=False):
+        return Response(sse_message(json.dumps({'success': False, 'message': '实时连接数已达上限'},
+                                               ensure_ascii=False), event='error'),
+                        status=503, mimetype='text/event-stream', headers={'Retry-After': '30'})
+    
+    def stream():
+        for message in generate():
+            if web_stopping.is_set():
+                return
+            yield message
+    
+    response = Response(stream(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # 名额在服务器关闭响应时释放：HEAD请求不会迭代生成器，只在生成器中释放会永久占用名额
+    response.call_on_close(stream_slots.release)
+    return response
+
+# 以SSE实时推送任务输出（测速进度等）
+@app.route('/api/jobs/<job_id>/stream')
+def job_stream(job_id):
+    job = job_runner.get(job_id)
+    
+    def generate():
+        if job is None:
+            yield sse_message(json.dumps({'success': False, 'message': '任务不存在'}, ensure_ascii=False), event='done')
+            return
+        for line in job.follow():
+            # None表示暂无新输出，发送注释行保持连接
+            yield ': keep-alive\n\n' if line is None else sse_message(line, event='progress')
+        yield sse_message(json.dumps(job.to_dict(), ensure_ascii=False), event='done')
+    
+    return sse_response(generate)
+
+# 事件流（SSE）：日志、任务状态与进度、IP变化、更新历史、容器推送结果
+# 所有连接共享同一个事件缓冲区；断线重连时浏览器会带上Last-Event-ID，从断点继续推送
+@app.route('/api/events')
+def event_stream():
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('since', type=int)
+    
+    def generate():
+        for item in event_bus.follow(last_id):
+            if item is None:
+                yield ': keep-alive\n\n'
+            else:
+                event_id, event, payload = item
+                yield sse_message(payload, event=event, event_id=event_id)
+    
+    return sse_response(generate)
+
+# Prometheus指标
+@app.route('/metrics')
+def api_metrics():
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# 获取最新日志（从内存缓冲区读取）
+# 不带cursor时返回最后lines行；cursor为上次返回的序号，只返回之后的日志（reset表示中间有日志已被挤出缓冲区）
+# 可按level（最低级别）、event、container筛选
 @app.route('/api/logs')
 def api_logs():
-    lines = request.args.get('lines', 50, type=int)
-    return jsonify({'logs': get_logs(lines)})
+    cursor = request.args.get('cursor', type=int)
+    lines = request.args.get('lines', type=int)
+    if cursor is None and lines is None:
+        lines = 50
+    entries, last_id, gap = log_buffer.query(
+        since=cursor, limit=lines, level=request.args.get('level'),
+        event=request.args.get('event'), container=request.args.get('container'))
+    result = {'logs': ''.join(entry['text'] + '\n' for entry in entries), 'cursor': last_id,
+              'reset': cursor is None or gap}
+    # format=json时返回结构化的日志条目，便于按事件类型、容器、耗时等字段筛选和统计
+    if request.args.get('format') == 'json':
+        result['records'] = entries
+    return jsonify(result)
+
+# 获取容器状态（短时缓存，refresh=1时强制刷新）
+@app.route('/api/containers')
+def api_containers():
+    refresh = request.args.get('refresh', '0') in ('1', 'true')
+    containers, updated_at = get_cached_container_status(refresh=refresh)
+    return jsonify({'containers': containers, 'updated_at': updated_at})
+
+class WebServer:
+    """生产环境WSGI服务器
+    
+    优先使用waitress（固定大小的工作线程池、keep-alive、连接数限制）；
+    未安装waitress时退化为Werkzeug的多线程服务器。
+    """
+    
+    def __init__(self, host='0.0.0.0', port=WEB_PORT, threads=WEB_THREADS):
+        try:
+            from waitress.server import create_server
+        except ImportError:
+            from werkzeug.serving import make_server
+            logger.warning("未安装waitress，使用Werkzeug多线程服务器")
+            self.engine = 'werkzeug'
+            self._server = make_server(host, port, app, threaded=True)
+        else:
+            self.engine = 'waitress'
+            # send_bytes=1：每次写出立即发送，事件流消息不在缓冲区中滞留
+            self._server = create_server(app, host=host, port=port, threads=threads,
+                                         connection_limit=WEB_CONNECTION_LIMIT,
+                                         channel_timeout=WEB_CHANNEL_TIMEOUT, send_bytes=1,
+                                         ident='CloudflareIP-HostsUpdater')
+        self.host, self.port, self.threads = host, port, threads
+    
+    def serve_forever(self):
+        logger.info(f"Web服务监听 {self.host}:{self.port}（{self.engine}，工作线程: {self.threads}）")
+        if self.engine == 'waitress':
+            self._server.run()
+        else:
+            self._server.serve_forever()
+    
+    def shutdown(self, timeout=WEB_SHUTDOWN_TIMEOUT):
+        """结束事件流，等待进行中的请求完成（最多timeout秒）后停止服务"""
+        logger.info("正在停止Web服务")
+        web_stopping.set()
+        event_bus.close()
+        if self.engine == 'waitress':
+            self._server.task_dispatcher.shutdown(cancel_pending=False, timeout=timeout)
+        else:
+            self._server.shutdown()
+            self._server.server_close()
 
-# 启动Web服务器
+# 启动Web服务器（阻塞运行，直到进程结束）
 def start_web_server():
-    app.run(host='0.0.0.0', port=WEB_PORT, debug=False)
+    WebServer().serve_forever()
 
 if __name__ == '__main__':
     start_web_server() 
\ No newline at end of file
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+更新流程基准测试
+完全离线运行：模拟CloudflareST生成合成测速结果，模拟Docker守护进程提供指定数量的容器，
+分别测量结果解析、hosts渲染、容器推送以及完整update_all_hosts流程的耗时和吞吐量，
+用于对比main.py修改前后的性能
+
+用法:
+    python benchmarks/bench_pipeline.py
+    python benchmarks/bench_pipeline.py --containers 1,10,100,1000 --latency 1 --rows 10000 --json
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import statistics
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.join(os.path.dirname(BENCH_DIR), 'app')
+sys.path.insert(0, BENCH_DIR)
+
+from fake_docker import FakeDockerServer, container_names
+from fake_cloudflarest import write_result_csv
+
+
+def p95(ordered):
+    """已排序样本的95分位（最近秩）"""
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+def summarize(name, samples, items=1, **info):
+    """汇总一组耗时样本（秒），items为每次处理的条目数，用于计算吞吐量"""
+    ordered = sorted(samples)
+    median = statistics.median(ordered)
+    return dict(info, name=name, runs=len(samples), items=items,
+                mean_ms=round(statistics.mean(ordered) * 1000, 3),
+                p50_ms=round(median * 1000, 3),
+                p95_ms=round(p95(ordered) * 1000, 3),
+                per_second=round(items / median, 1) if median > 0 else None)
+
+
+def timed(func, repeat):
+    samples = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - start)
+    return samples, result
+
+
+def setup_environment(args, data_dir, socket_path):
+    """main在导入时读取环境变量和数据目录，必须在导入前准备好"""
+    os.environ.update({
+        'DATA_DIR': data_dir,
+        'DOCKER_HOST': f"unix://{socket_path}",
+        'CLOUDFLAREST_BIN': os.path.join(BENCH_DIR, 'fake_cloudflarest.py'),
+        'FAKE_CFST_ROWS': str(args.rows),
+        'PUSH_WORKERS': str(args.workers),
+        'WATCH_DOCKER_EVENTS': 'false',
+        'SPEED_TEST_ENGINE': 'cloudflarest',
+        'IP_SELECTION': 'latest',
+        'PER_DOMAIN_SELECTION': 'false',
+    })
+    os.environ.pop('DOCKER_HOSTS', None)
+    domains = ','.join(f"bench{i}.example.com" for i in range(args.domains))
+    with open(os.path.join(data_dir, 'config.toml'), 'w', encoding='utf-8') as f:
+        f.write('[general]\n'
+                'update_interval = "12h"\n'
+                'target_containers = ""\n'
+                f'cf_domains = "{domains}"\n'
+                f'ip_count = {args.ip_count}\n'
+                'preferred_ip = ""\n'
+                'speed_test_args = ""\n')
+    write_result_csv(os.path.join(data_dir, 'result.csv'), args.rows)
+
+
+def bench_parse(main, args):
+    """解析：完整读取结果文件，以及只读取前IP_COUNT行（实际流程的用法）"""
+    results = []
+    samples, records = timed(lambda: list(main.iter_speedtest_results()), args.repeat)
+    results.append(summarize('parse_full', samples, items=len(records), rows=args.rows))
+    samples, _ = timed(lambda: main.parse_speedtest_results(), args.repeat)
+    results.append(summarize('parse_top', samples, items=args.ip_count, rows=args.rows))
+    return results
+
+
+def bench_render(main, args):
+    """渲染：生成每个域名的IP对照表并渲染hosts内容"""
+    config = main.load_config()
+    candidates = main.parse_speedtest_results(config=config)
+    samples, _ = timed(lambda: main.generate_hosts_content(main.build_ip_table(candidates, config=config)),
+                       args.repeat)
+    return [summarize('render', samples, items=len(config['CF_DOMAINS']), domains=len(config['CF_DOMAINS']))]
+
+
+def bench_push(main, server, args, count):
+    """推送：首次写入（updated）和内容未变化时的跳过（unchanged）"""
+    config = main.load_config()
+    hosts_content = main.generate_hosts_content(
+        main.build_ip_table(main.parse_speedtest_results(config=config), config=config))
+    names = container_names(count)
+    results = []
+    for phase in ('updated', 'unchanged'):
+        samples, latencies = [], []
+        for _ in range(args.repeat):
+            if phase == 'updated':
+                server.state.reset_hosts()
+            start = time.perf_counter()
+            report = main.update_containers_hosts(names, hosts_content)
+            samples.append(time.perf_counter() - start)
+            latencies.extend(result['elapsed'] for result in report['results'].values())
+            if report['failed']:
+                raise RuntimeError(f"推送失败: {report['failed']}/{report['total']}")
+        summary = summarize(f"push_{phase}", samples, items=count, containers=count)
+        ordered = sorted(latencies)
+        summary['container_p50_ms'] = round(statistics.median(ordered) * 1000, 3)
+        summary['container_p95_ms'] = round(p95(ordered) * 1000, 3)
+        results.append(summary)
+    return results
+
+
+def bench_cycle(main, server, args, count):
+    """完整流程：模拟测速、解析、渲染、保存、推送和记录历史"""
+    main.save_config(dict(main.load_config(), TARGET_CONTAINERS=container_names(count)))
+    samples = []
+    for _ in range(args.cycle_repeat):
+        server.state.reset_hosts()
+        start = time.perf_counter()
+        if not main.update_all_hosts():
+            raise RuntimeError("update_all_hosts失败")
+        samples.append(time.perf_counter() - start)
+    return [summarize('cycle', samples, items=count, containers=count)]
+
+
+def print_table(results):
+    columns = ('name', 'containers', 'runs', 'mean_ms', 'p50_ms', 'p95_ms', 'per_second',
+               'container_p50_ms', 'container_p95_ms')
+    rows = [[str(result.get(column, '')) for column in columns] for result in results]
+    widths = [max(len(column), *(len(row[i]) for row in rows)) for i, column in enumerate(columns)]
+    print('  '.join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线基准测试：解析、渲染、推送和完整更新流程')
+    parser.add_argument('--containers', default='1,10,100,1000', help='逗号分隔的容器数量')
+    parser.add_argument('--latency', type=float, default=0.0, help='模拟Docker每个请求的延迟（毫秒）')
+    parser.add_argument('--rows', type=int, default=10000, help='合成测速结果的行数')
+    parser.add_argument('--domains', type=int, default=20, help='域名数量')
+    parser.add_argument('--ip-count', type=int, default=3, help='每个域名写入的IP数量')
+    parser.add_argument('--workers', type=int, default=8, help='PUSH_WORKERS')
+    parser.add_argument('--repeat', type=int, default=5, help='每项测量的重复次数')
+    parser.add_argument('--cycle-repeat', type=int, default=2, help='完整流程的重复次数')
+    parser.add_argument('--writable-hosts', action='store_true',
+                        help='模拟可通过归档接口覆盖的/etc/hosts（默认与真实容器一样为bind mount，经exec写入）')
+    parser.add_argument('--json', action='store_true', help='以JSON输出结果')
+    args = parser.parse_args()
+    counts = [int(c) for c in args.containers.split(',') if c.strip()]
+
+    data_dir = tempfile.mkdtemp(prefix='cfhosts-bench-')
+    socket_path = os.path.join(data_dir, 'docker.sock')
+    server = FakeDockerServer(socket_path, container_names(max(counts)), latency=args.latency / 1000,
+                              bind_mounted_hosts=not args.writable_hosts).start()
+    try:
+        setup_environment(args, data_dir, socket_path)
+        sys.path.insert(0, APP_DIR)
+        import main as app_main
+        # 只保留警告和错误，避免日志输出影响计时
+        app_main.logger.setLevel(logging.WARNING)
+
+        results = bench_parse(app_main, args) + bench_render(app_main, args)
+        for count in counts:
+            results += bench_push(app_main, server, args, count)
+            results += bench_cycle(app_main, server, args, count)
+        if args.json:
+            print(json.dumps({'params': vars(args), 'docker_requests': server.state.requests,
+                              'results': results}, ensure_ascii=False, indent=2))
+        else:
+            print_table(results)
+    finally:
+        server.stop()
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
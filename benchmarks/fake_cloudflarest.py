@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+模拟CloudflareST
+接受与CloudflareST相同的 -o 参数，输出进度行并写入指定行数的合成result.csv（按延迟升序），
+行数由 FAKE_CFST_ROWS 环境变量或 --rows 指定，FAKE_CFST_DELAY 可模拟测速耗时（秒）
+"""
+
+import os
+import time
+import random
+import argparse
+
+HEADER = 'IP 地址,已发送,已接收,丢包率,平均延迟,下载速度 (MB/s),地区码'
+COLOS = ('HKG', 'NRT', 'SJC', 'LAX', 'SIN', 'FRA')
+
+
+def write_result_csv(path, rows, seed=0):
+    """写入rows行合成测速结果，返回文件大小（字节）"""
+    rng = random.Random(seed)
+    latencies = sorted(rng.uniform(50, 400) for _ in range(rows))
+    lines = [HEADER]
+    for i, latency in enumerate(latencies):
+        ip = f"104.{16 + i // 65536 % 16}.{i // 256 % 256}.{i % 256}"
+        lines.append(f"{ip},4,4,0.00,{latency:.2f},{rng.uniform(0, 50):.2f},{COLOS[i % len(COLOS)]}")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟CloudflareST，写入合成测速结果')
+    parser.add_argument('-o', dest='output', default='result.csv', help='结果文件路径')
+    parser.add_argument('--rows', type=int, default=int(os.environ.get('FAKE_CFST_ROWS', '1000')))
+    parser.add_argument('--delay', type=float, default=float(os.environ.get('FAKE_CFST_DELAY', '0')))
+    # 其余CloudflareST参数（-n、-t、-tl等）忽略
+    args, _ = parser.parse_known_args()
+
+    for percent in (0, 25, 50, 75, 100):
+        print(f"\r{percent * args.rows // 100} / {args.rows} [{'=' * (percent // 10):<10}]", end='', flush=True)
+        if args.delay and percent:
+            time.sleep(args.delay / 4)
+    print()
+    write_result_csv(args.output, args.rows)
+    print(f"完整测速结果已写入 {args.output} 文件")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+模拟Docker守护进程
+在unix socket上实现更新器用到的Docker Engine API子集（归档读写、exec、容器列表、事件流），
+每个请求可附加固定延迟，容器数量可配置；容器的/etc/hosts保存在内存中，用于离线基准测试。
+与真实容器一样，/etc/hosts默认视为bind mount，拒绝通过归档接口覆盖，只能经exec的stdin写入
+"""
+
+import io
+import sys
+import json
+import time
+import base64
+import struct
+import tarfile
+import argparse
+import threading
+import socketserver
+from urllib.parse import urlsplit, parse_qs
+
+DEFAULT_HOSTS = "127.0.0.1\tlocalhost\n::1\tlocalhost ip6-localhost ip6-loopback\n"
+
+# 真实守护进程覆盖bind mount的/etc/hosts时返回的错误
+BIND_MOUNT_ERROR = "Error processing tar file(exit status 1): unlinkat /etc/hosts: device or resource busy"
+
+
+def container_names(count, prefix='bench'):
+    return [f"{prefix}-{i:04d}" for i in range(count)]
+
+
+class FakeDockerState:
+    """模拟守护进程的状态：容器 -> hosts内容，exec实例，请求计数"""
+
+    def __init__(self, containers, latency=0.0, bind_mounted_hosts=True):
+        self.latency = latency
+        self.bind_mounted_hosts = bind_mounted_hosts
+        self.hosts = {name: DEFAULT_HOSTS.encode('utf-8') for name in containers}
+        self.execs = {}
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def reset_hosts(self):
+        with self.lock:
+            for name in self.hosts:
+                self.hosts[name] = DEFAULT_HOSTS.encode('utf-8')
+
+
+class FakeDockerHandler(socketserver.StreamRequestHandler):
+    """按HTTP/1.1 keep-alive处理同一连接上的多个请求"""
+
+    def send(self, status, body=b'', content_type='application/json', headers=None):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode('utf-8')
+        head = [f"HTTP/1.1 {status} X", f"Content-Type: {content_type}", f"Content-Length: {len(body)}"]
+        head += [f"{key}: {value}" for key, value in (headers or {}).items()]
+        self.wfile.write(('\r\n'.join(head) + '\r\n\r\n').encode('ascii') + body)
+        self.wfile.flush()
+
+    def handle(self):
+        state = self.server.state
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            method, target, _ = line.decode('ascii').split(' ', 2)
+            headers = {}
+            while True:
+                header = self.rfile.readline().decode('latin-1')
+                if header in ('\r\n', ''):
+                    break
+                key, value = header.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+            body = self.rfile.read(int(headers.get('content-length', 0)))
+            with state.lock:
+                state.requests += 1
+            if state.latency:
+                time.sleep(state.latency)
+            if not self.route(state, method, target, body):
+                return
+
+    def route(self, state, method, target, body):
+        """处理一个请求，返回False表示连接已被接管或应关闭"""
+        url = urlsplit(target)
+        parts = url.path.strip('/').split('/')
+        query = parse_qs(url.query)
+
+        if parts == ['_ping']:
+            self.send(200, b'OK', 'text/plain')
+        elif parts == ['events']:
+            # 保持连接直到服务停止，不产生事件
+            self.wfile.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Transfer-Encoding: chunked\r\n\r\n")
+            self.wfile.flush()
+            state.stopped.wait()
+            return False
+        elif parts == ['containers', 'json']:
+            self.send(200, [{'Id': name, 'Names': [f"/{name}"], 'Labels': {}} for name in state.hosts])
+        elif len(parts) == 3 and parts[0] == 'containers' and parts[1] not in state.hosts:
+            self.send(404, {'message': f"No such container: {parts[1]}"})
+        elif len(parts) == 3 and parts[0] == 'containers' and parts[2] == 'archive':
+            name = parts[1]
+            if method == 'GET':
+                self.send_archive(state, name, query.get('path', ['/etc/hosts'])[0])
+            else:
+                self.receive_archive(state, name, body)
+        elif len(parts) == 3 and parts[0] == 'containers' and parts[2] == 'exec':
+            with state.lock:
+                exec_id = f"exec{len(state.execs) + 1}"
+                state.execs[exec_id] = dict(json.loads(body or b'{}'), container=parts[1])
+            self.send(201, {'Id': exec_id})
+        elif len(parts) == 3 and parts[0] == 'exec' and parts[2] == 'start':
+            self.run_exec(state, parts[1])
+            return False
+        elif len(parts) == 3 and parts[0] == 'exec' and parts[2] == 'json':
+            self.send(200, {'ExitCode': 0, 'Running': False})
+        else:
+            self.send(404, {'message': f"page not found: {url.path}"})
+        return True
+
+    def send_archive(self, state, name, path):
+        content = state.hosts[name]
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w') as tar:
+            info = tarfile.TarInfo(path.rsplit('/', 1)[-1])
+            info.size = len(content)
+            info.mode = 0o644
+            tar.addfile(info, io.BytesIO(content))
+        stat = base64.b64encode(json.dumps({'name': 'hosts', 'size': len(content), 'mode': 0o644}).encode())
+        self.send(200, buffer.getvalue(), 'application/x-tar', {'X-Docker-Container-Path-Stat': stat.decode()})
+
+    def receive_archive(self, state, name, body):
+        with tarfile.open(fileobj=io.BytesIO(body)) as tar:
+            members = tar.getmembers()
+            if state.bind_mounted_hosts and any(member.name == 'hosts' for member in members):
+                self.send(500, {'message': BIND_MOUNT_ERROR})
+                return
+            for member in members:
+                if member.name == 'hosts':
+                    state.hosts[name] = tar.extractfile(member).read()
+        self.send(200)
+
+    def run_exec(self, state, exec_id):
+        """劫持连接：若exec附加了stdin，读到EOF后作为新的/etc/hosts内容（对应exec写入的退化路径）"""
+        self.wfile.write(b"HTTP/1.1 101 UPGRADED\r\nContent-Type: application/vnd.docker.raw-stream\r\n"
+                         b"Connection: Upgrade\r\nUpgrade: tcp\r\n\r\n")
+        self.wfile.flush()
+        config = state.execs.get(exec_id, {})
+        if config.get('AttachStdin'):
+            content = self.rfile.read()
+            with state.lock:
+                state.hosts[config['container']] = content
+        output = b''
+        self.wfile.write(struct.pack('>BxxxL', 1, len(output)) + output)
+        self.wfile.flush()
+
+
+class FakeDockerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """在后台线程中运行的模拟守护进程"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, containers, latency=0.0, bind_mounted_hosts=True):
+        super().__init__(socket_path, FakeDockerHandler)
+        self.socket_path = socket_path
+        self.state = FakeDockerState(containers, latency, bind_mounted_hosts)
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"unix://{self.socket_path}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-docker', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.state.stopped.set()
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟Docker守护进程（unix socket）')
+    parser.add_argument('socket', help='unix socket路径')
+    parser.add_argument('--containers', type=int, default=10, help='模拟的容器数量')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求附加的延迟（毫秒）')
+    parser.add_argument('--writable-hosts', action='store_true', help='允许通过归档接口覆盖/etc/hosts')
+    args = parser.parse_args()
+
+    server = FakeDockerServer(args.socket, container_names(args.containers), args.latency / 1000,
+                              bind_mounted_hosts=not args.writable_hosts)
+    print(f"模拟Docker守护进程: {server.base_url}，容器: {args.containers} 个，延迟: {args.latency}ms",
+          file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()